@@ -8,6 +8,7 @@ from rest_framework.authtoken import views as drf_views
 router = routers.DefaultRouter()
 router.register(r'named-storms', storm_viewsets.NamedStormViewSet)
 router.register(r'covered-data', storm_viewsets.CoveredDataViewSet)
+router.register(r'covered-data-snapshots', storm_viewsets.NamedStormCoveredDataSnapshotViewSet)
 router.register(r'nsem', storm_viewsets.NSEMViewset)
 router.register(r'coastal-act-projects', coastal_act_viewsets.CoastalActProjectViewSet)
 router.register(r'user', coastal_act_viewsets.CurrentUserViewSet)
@@ -14,6 +14,7 @@ import os
 import sys
 import raven
 import dj_database_url
+from kombu import Queue
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -275,6 +276,61 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@cwwed-staging.com'
 
+# celery
+# tasks are routed to queues by the kind of work they do so each queue can be served by an appropriate worker pool:
+#   - io: network bound (downloads & orchestration) served by a high concurrency gevent pool
+#   - cpu: numpy/xarray/hdf post-processing served by a prefork pool sized to the cores
+#   - archive: disk bound tar archiving/extraction
+#   - email: notifications
+#   - highmem: datasets whose estimated peak memory exceeds CWWED_HIGH_MEMORY_THRESHOLD served by a worker with plenty of memory
+# NOTE: the queues are named apart from any previously declared (non priority) queues since RabbitMQ refuses to
+# redeclare an existing queue with different arguments (PRECONDITION_FAILED)
+CWWED_QUEUE_DEFAULT = 'cwwed.default'
+CWWED_QUEUE_IO = 'cwwed.io'
+CWWED_QUEUE_CPU = 'cwwed.cpu'
+CWWED_QUEUE_ARCHIVE = 'cwwed.archive'
+CWWED_QUEUE_EMAIL = 'cwwed.email'
+CWWED_QUEUE_HIGH_MEMORY = 'cwwed.highmem'
+CWWED_CELERY_IO_CONCURRENCY = int(os.environ.get('CWWED_CELERY_IO_CONCURRENCY', 100))
+CWWED_CELERY_ARCHIVE_CONCURRENCY = int(os.environ.get('CWWED_CELERY_ARCHIVE_CONCURRENCY', 2))
+CWWED_CELERY_HIGH_MEMORY_CONCURRENCY = int(os.environ.get('CWWED_CELERY_HIGH_MEMORY_CONCURRENCY', 2))
+# queues support priorities so the largest datasets can be scheduled first
+CWWED_TASK_MAX_PRIORITY = 9
+CELERY_TASK_DEFAULT_QUEUE = CWWED_QUEUE_DEFAULT
+CELERY_TASK_QUEUES = [
+    Queue(name, routing_key=name, queue_arguments={'x-max-priority': CWWED_TASK_MAX_PRIORITY})
+    for name in (CWWED_QUEUE_DEFAULT, CWWED_QUEUE_IO, CWWED_QUEUE_CPU, CWWED_QUEUE_ARCHIVE, CWWED_QUEUE_EMAIL, CWWED_QUEUE_HIGH_MEMORY)
+]
+# only reserve one task at a time so higher priority tasks aren't stuck behind prefetched ones
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# periodically re-collect active storms (via celery beat)
+CWWED_REFRESH_INTERVAL = int(os.environ.get('CWWED_REFRESH_INTERVAL', 60 * 60))  # seconds
+CWWED_REFRESH_RUNNING_TIMEOUT = int(os.environ.get('CWWED_REFRESH_RUNNING_TIMEOUT', 60 * 60 * 12))  # seconds before a running collection is considered abandoned
+CELERY_BEAT_SCHEDULE = {
+    'refresh-active-storms': {
+        'task': 'named_storms.tasks.refresh_active_storms_task',
+        'schedule': CWWED_REFRESH_INTERVAL,
+    },
+}
+CELERY_TASK_ROUTES = {
+    'named_storms.tasks.fetch_url_task': {'queue': CWWED_QUEUE_IO},
+    # cpu bound processors are explicitly sent to the cpu queue when they're dispatched
+    'named_storms.tasks.process_dataset_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.collect_covered_data_provider_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.collect_covered_data_race_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.provider_discovery_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.provider_race_timeout_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.collect_covered_data_finalize_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.collect_covered_data_complete_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.collect_covered_data_watchdog_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.refresh_active_storms_task': {'queue': CWWED_QUEUE_IO},
+    'named_storms.tasks.archive_named_storm_covered_data_task': {'queue': CWWED_QUEUE_ARCHIVE},
+    'named_storms.tasks.archive_nsem_covered_data_task': {'queue': CWWED_QUEUE_ARCHIVE},
+    'named_storms.tasks.extract_nsem_covered_data_task': {'queue': CWWED_QUEUE_ARCHIVE},
+    'named_storms.tasks.extract_nsem_model_output_task': {'queue': CWWED_QUEUE_ARCHIVE},
+    'named_storms.tasks.email_nsem_covered_data_complete_task': {'queue': CWWED_QUEUE_EMAIL},
+}
+
 #
 # CWWED
 #
@@ -286,12 +342,104 @@ CWWED_OPENDAP_DIR = 'OPENDAP'
 CWWED_COVERED_DATA_DIR_NAME = 'Covered Data'
 CWWED_COVERED_ARCHIVE_DIR_NAME = 'Covered Data Archive'
 CWWED_COVERED_DATA_INCOMPLETE_DIR_NAME = '.incomplete'
+CWWED_COVERED_DATA_MANIFEST_FILE_NAME = '.manifest.json'
+
+# retry only the failed datasets of a collection (with exponential backoff) until the failure budget is spent
+CWWED_COLLECTION_RETRY_ROUNDS = int(os.environ.get('CWWED_COLLECTION_RETRY_ROUNDS', 3))
+CWWED_COLLECTION_RETRY_BACKOFF = int(os.environ.get('CWWED_COLLECTION_RETRY_BACKOFF', 30))  # seconds
+CWWED_COLLECTION_FAILURE_BUDGET = int(os.environ.get('CWWED_COLLECTION_FAILURE_BUDGET', 100))  # total number of dataset retries
+# datasets whose task was lost (i.e the worker was killed or the task revoked) are failed once they haven't been updated in a while
+CWWED_COLLECTION_ITEM_TIMEOUT = int(os.environ.get('CWWED_COLLECTION_ITEM_TIMEOUT', 60 * 60 * 6))  # seconds
+CWWED_COLLECTION_WATCHDOG_INTERVAL = int(os.environ.get('CWWED_COLLECTION_WATCHDOG_INTERVAL', 60 * 10))  # seconds
+# how long the collect_covered_data command reports progress before giving up
+CWWED_COLLECTION_PROGRESS_TIMEOUT = int(os.environ.get('CWWED_COLLECTION_PROGRESS_TIMEOUT', 60 * 60 * 24))  # seconds
+
+# partial downloads (kept so a retry can resume) which haven't been written to in this long are removed
+CWWED_PARTIAL_FILE_MAX_AGE = int(os.environ.get('CWWED_PARTIAL_FILE_MAX_AGE', 60 * 60 * 24 * 3))  # seconds
+
+# large files are downloaded in concurrent byte range segments when the server supports it
+CWWED_SEGMENTED_DOWNLOAD_THRESHOLD = int(os.environ.get('CWWED_SEGMENTED_DOWNLOAD_THRESHOLD', 100 * 1024 * 1024))  # bytes
+CWWED_SEGMENTED_DOWNLOAD_SEGMENTS = int(os.environ.get('CWWED_SEGMENTED_DOWNLOAD_SEGMENTS', 8))
+CWWED_SEGMENTED_DOWNLOAD_HOST_CONNECTIONS = int(os.environ.get('CWWED_SEGMENTED_DOWNLOAD_HOST_CONNECTIONS', 8))  # per worker process
+
+# downloads shared across storms (keyed by url & upstream validators) are cached on the data volume so they can be hard-linked
+CWWED_DOWNLOAD_CACHE_DIR = os.path.join(CWWED_DATA_DIR, '.cache')
+CWWED_DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get('CWWED_DOWNLOAD_CACHE_MAX_BYTES', 50 * 1024 * 1024 * 1024))  # zero disables the cache
+
+# shared (per worker process) http sessions and ftp connections
+CWWED_HTTP_POOL_SIZE = int(os.environ.get('CWWED_HTTP_POOL_SIZE', 10))  # connections per host
+CWWED_HTTP_RETRIES = int(os.environ.get('CWWED_HTTP_RETRIES', 3))
+CWWED_HTTP_RETRY_BACKOFF = float(os.environ.get('CWWED_HTTP_RETRY_BACKOFF', 0.5))  # seconds
+CWWED_FTP_POOL_SIZE = int(os.environ.get('CWWED_FTP_POOL_SIZE', 4))  # idle connections per host
+CWWED_FTP_TIMEOUT = int(os.environ.get('CWWED_FTP_TIMEOUT', 60))  # seconds
+
+# adaptive per host throttle (token bucket per process which syncs with every other worker via the data volume)
+CWWED_THROTTLE_ENABLED = os.environ.get('CWWED_THROTTLE_ENABLED', '1') == '1'
+CWWED_THROTTLE_DIR = os.path.join(CWWED_DATA_DIR, '.throttle')
+CWWED_THROTTLE_INITIAL_RATE = float(os.environ.get('CWWED_THROTTLE_INITIAL_RATE', 10))  # requests per second
+CWWED_THROTTLE_MIN_RATE = float(os.environ.get('CWWED_THROTTLE_MIN_RATE', 0.2))
+CWWED_THROTTLE_MAX_RATE = float(os.environ.get('CWWED_THROTTLE_MAX_RATE', 100))
+CWWED_THROTTLE_BURST = float(os.environ.get('CWWED_THROTTLE_BURST', 20))  # tokens
+CWWED_THROTTLE_RATE_INCREASE = float(os.environ.get('CWWED_THROTTLE_RATE_INCREASE', 0.1))  # added per successful response
+CWWED_THROTTLE_RATE_DECREASE = float(os.environ.get('CWWED_THROTTLE_RATE_DECREASE', 0.5))  # multiplied per throttled response
+CWWED_THROTTLE_RETRIES = int(os.environ.get('CWWED_THROTTLE_RETRIES', 5))  # throttled responses retried before failing
+CWWED_THROTTLE_SYNC_INTERVAL = float(os.environ.get('CWWED_THROTTLE_SYNC_INTERVAL', 5))  # seconds between syncs (throttled responses sync immediately)
+
+# task results larger than this are written to the scratch store (on the data volume) and returned as references
+CWWED_TASK_RESULT_INLINE_BYTES = int(os.environ.get('CWWED_TASK_RESULT_INLINE_BYTES', 64 * 1024))
+CWWED_SCRATCH_DIR = os.path.join(CWWED_DATA_DIR, '.scratch')
+CWWED_SCRATCH_MAX_AGE = int(os.environ.get('CWWED_SCRATCH_MAX_AGE', 60 * 60 * 24))  # seconds
+
+# opendap subsets are retrieved (and appended to the output) in time chunks of roughly this size
+CWWED_OPENDAP_CHUNK_BYTES = int(os.environ.get('CWWED_OPENDAP_CHUNK_BYTES', 256 * 1024 * 1024))
+CWWED_OPENDAP_CHUNKS_IN_FLIGHT = int(os.environ.get('CWWED_OPENDAP_CHUNKS_IN_FLIGHT', 2))
+
+# how netcdf/hdf output is written: compression, lossless packing (when the source was packed) and chunk shapes
+CWWED_NETCDF_OUTPUT_PROFILE = {
+    'zlib': os.environ.get('CWWED_NETCDF_ZLIB', '1') == '1',
+    'complevel': int(os.environ.get('CWWED_NETCDF_COMPLEVEL', 4)),
+    'shuffle': os.environ.get('CWWED_NETCDF_SHUFFLE', '1') == '1',
+    'pack': os.environ.get('CWWED_NETCDF_PACK', '1') == '1',
+    'chunk_time': int(os.environ.get('CWWED_NETCDF_CHUNK_TIME', 24)),  # time steps per chunk
+    'chunk_other': int(os.environ.get('CWWED_NETCDF_CHUNK_OTHER', 128)),  # values per chunk along every other dimension
+}
+
+# estimate every dataset's size (from the catalog, previous manifest or upstream) so the largest are dispatched first
+CWWED_ESTIMATE_DATASET_SIZES = os.environ.get('CWWED_ESTIMATE_DATASET_SIZES', '1') == '1'
+CWWED_ESTIMATE_DATASET_SIZES_CONCURRENCY = int(os.environ.get('CWWED_ESTIMATE_DATASET_SIZES_CONCURRENCY', 8))
+
+# memory aware scheduling: processors estimate their peak memory, datasets above the threshold are routed to the "highmem" queue
+# and workers refuse to start datasets which would exceed their budget (defaults to a ratio of the container's memory limit)
+CWWED_PROCESSOR_BASELINE_MEMORY = int(os.environ.get('CWWED_PROCESSOR_BASELINE_MEMORY', 256 * 1024 * 1024))  # bytes
+CWWED_HDF_MEMORY_FACTOR = float(os.environ.get('CWWED_HDF_MEMORY_FACTOR', 4))  # peak memory per (compressed) byte of granule
+CWWED_HIGH_MEMORY_THRESHOLD = int(os.environ.get('CWWED_HIGH_MEMORY_THRESHOLD', 2 * 1024 * 1024 * 1024))  # bytes
+CWWED_WORKER_MEMORY_BUDGET = int(os.environ.get('CWWED_WORKER_MEMORY_BUDGET', 0))  # bytes (zero uses the container's limit)
+CWWED_WORKER_MEMORY_BUDGET_RATIO = float(os.environ.get('CWWED_WORKER_MEMORY_BUDGET_RATIO', 0.8))
+CWWED_WORKER_MEMORY_WAIT = int(os.environ.get('CWWED_WORKER_MEMORY_WAIT', 60))  # seconds to wait for memory before refusing
+CWWED_WORKER_MEMORY_REROUTE_DELAY = int(os.environ.get('CWWED_WORKER_MEMORY_REROUTE_DELAY', 30))  # seconds before a refused dataset is rerouted
+CWWED_WORKER_MEMORY_LEDGER = os.environ.get('CWWED_WORKER_MEMORY_LEDGER', '/tmp/cwwed-memory-ledger.json')  # local to the worker
+
+# how long to wait for any provider's discovery when racing providers (the unfinished providers are then collected sequentially)
+CWWED_PROVIDER_RACE_TIMEOUT = int(os.environ.get('CWWED_PROVIDER_RACE_TIMEOUT', 60 * 60))  # seconds
 
 CWWED_NSEM_DIR_NAME = 'NSEM'
 CWWED_NSEM_PSA_DIR_NAME = 'Post Storm Assessment'
 CWWED_NSEM_UPLOAD_DIR_NAME = 'upload'
-CWWED_NSEM_ARCHIVE_WRITE_MODE = 'w:gz'
-CWWED_NSEM_ARCHIVE_READ_MODE = 'r:gz'
+# covered data archive compression ("gzip" or "zstd") which is compressed in independent blocks on several threads
+CWWED_ARCHIVE_COMPRESSION = os.environ.get('CWWED_ARCHIVE_COMPRESSION', 'gzip')
+CWWED_ARCHIVE_COMPRESSION_LEVEL = int(os.environ.get('CWWED_ARCHIVE_COMPRESSION_LEVEL', 6))
+CWWED_ARCHIVE_COMPRESSION_BLOCK_BYTES = int(os.environ.get('CWWED_ARCHIVE_COMPRESSION_BLOCK_BYTES', 4 * 1024 * 1024))
+CWWED_ARCHIVE_COMPRESSION_THREADS = int(os.environ.get('CWWED_ARCHIVE_COMPRESSION_THREADS', os.cpu_count() or 1))
+# threads decompressing (parallel gzip) archives when extracting (1 decompresses sequentially)
+CWWED_ARCHIVE_EXTRACT_THREADS = int(os.environ.get('CWWED_ARCHIVE_EXTRACT_THREADS', os.cpu_count() or 1))
+# sidecar index (of every file's compressed byte range) stored alongside each covered data archive
+CWWED_ARCHIVE_INDEX_EXTENSION = 'index.json'
+# size of each part (and number of parts in flight) when streaming archives to object storage
+CWWED_ARCHIVE_UPLOAD_PART_BYTES = int(os.environ.get('CWWED_ARCHIVE_UPLOAD_PART_BYTES', 64 * 1024 * 1024))
+CWWED_ARCHIVE_UPLOAD_CONCURRENCY = int(os.environ.get('CWWED_ARCHIVE_UPLOAD_CONCURRENCY', 4))
+# concurrent server side copies (and parts of each large copy) within object storage
+CWWED_ARCHIVE_COPY_CONCURRENCY = int(os.environ.get('CWWED_ARCHIVE_COPY_CONCURRENCY', 8))
+CWWED_ARCHIVE_COPY_PART_BYTES = int(os.environ.get('CWWED_ARCHIVE_COPY_PART_BYTES', 64 * 1024 * 1024))
 CWWED_NSEM_USER = 'nsem'
 CWWED_NSEM_PASSWORD = os.environ.get('CWWED_NSEM_PASSWORD')
 
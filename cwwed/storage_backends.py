@@ -1,6 +1,10 @@
 import os
 import boto3
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 from named_storms.utils import create_directory
@@ -11,6 +15,8 @@ class S3ObjectStorage(S3Boto3Storage):
     AWS S3 Storage backend
     """
 
+    _s3 = None
+
     def __init__(self, *args, **kwargs):
         self.location = 'Coastal Act'
         self.default_acl = 'public-read'
@@ -23,15 +29,18 @@ class S3ObjectStorage(S3Boto3Storage):
         super().__init__(*args, **kwargs)
 
     def _get_s3_client(self):
-        # create s3 client
-        return boto3.resource(
-            's3',
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
-        )
+        # create the s3 resource once per storage instance (its underlying `meta.client` is safe to share between threads)
+        if self._s3 is None:
+            self._s3 = boto3.resource(
+                's3',
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            )
+        return self._s3
 
 
 class S3ObjectStoragePrivate(S3ObjectStorage):
+    READ_RANGE_CHUNK_SIZE = 1024 * 1024
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -68,27 +77,67 @@ class S3ObjectStoragePrivate(S3ObjectStorage):
 
     def copy_within_storage(self, source: str, destination: str):
         """
-        Copies an S3 object to another location within the same bucket
+        Copies an S3 object to another location within the same bucket (server side).
+        Any existing destination is simply overwritten and large objects are copied in concurrent parts.
         """
 
-        if not self.exists(source):
-            logging.warning('skipping source that does not exist: {}'.format(source))
-            return
-
-        # delete any existing version if it exists
-        if self.exists(destination):
-            self.delete(destination)
-
         # create absolute references to account for the object storage "location" (prefix)
         source_absolute = self.path(source)
         destination_absolute = self.path(destination)
 
-        s3 = self._get_s3_client()
         copy_source = {
             'Bucket': settings.AWS_ARCHIVE_BUCKET_NAME,
             'Key': source_absolute,
         }
-        s3.meta.client.copy(copy_source, self.bucket_name, destination_absolute)
+        config = TransferConfig(
+            multipart_threshold=settings.CWWED_ARCHIVE_COPY_PART_BYTES,
+            multipart_chunksize=settings.CWWED_ARCHIVE_COPY_PART_BYTES,
+            max_concurrency=settings.CWWED_ARCHIVE_COPY_CONCURRENCY,
+        )
+        try:
+            # the managed copy's single HEAD request determines whether (and how) to copy in parts
+            self._get_s3_client().meta.client.copy(copy_source, self.bucket_name, destination_absolute, Config=config)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+                raise
+            logging.warning('skipping source that does not exist: {}'.format(source))
+
+    def copy_many_within_storage(self, paths: list):
+        """
+        Concurrently copies S3 objects within the same bucket using the storage's shared client
+        :param paths: list of (source, destination) tuples
+        """
+        # create the shared resource before the threads use it
+        self._get_s3_client()
+        with ThreadPoolExecutor(max_workers=settings.CWWED_ARCHIVE_COPY_CONCURRENCY) as executor:
+            futures = [executor.submit(self.copy_within_storage, source, destination) for source, destination in paths]
+            for future in futures:
+                future.result()
+
+    def read_range(self, path: str, offset: int, length: int):
+        """
+        :return: generator of the bytes within a range of an object (retrieved with a single ranged request)
+        """
+        response = self._get_s3_client().meta.client.get_object(
+            Bucket=self.bucket_name,
+            Key=self.path(path),
+            Range='bytes={}-{}'.format(offset, offset + length - 1),
+        )
+        body = response['Body']
+        return iter(lambda: body.read(self.READ_RANGE_CHUNK_SIZE), b'')
+
+    def multipart_upload(self, path: str):
+        """
+        :return: writable stream which uploads to the path in parts as it's written (see S3MultipartUpload)
+        """
+        return S3MultipartUpload(
+            client=self._get_s3_client().meta.client,
+            bucket=self.bucket_name,
+            key=self.path(path),
+            part_size=settings.CWWED_ARCHIVE_UPLOAD_PART_BYTES,
+            concurrency=settings.CWWED_ARCHIVE_UPLOAD_CONCURRENCY,
+            ACL=self.default_acl,
+        )
 
     def path(self, path):
         """
@@ -103,3 +152,81 @@ class S3ObjectStoragePrivate(S3ObjectStorage):
             self.location,
             path,
         )
+
+
+class S3MultipartUpload:
+    """
+    Writable stream (i.e for a streaming tarfile) which uploads to an S3 object in parts as it's written.
+
+    Parts are uploaded concurrently while the writer keeps producing data, and writes block once `concurrency` parts
+    are in flight so memory is bounded to roughly `part_size * (concurrency + 1)`.
+    Used as a context manager, the upload is completed on success and aborted on any exception so no partial object is left.
+    """
+    # S3 requires every part (except the last) to be at least 5MB and allows at most 10,000 parts
+    MIN_PART_SIZE = 5 * 1024 * 1024
+    MAX_PARTS = 10000
+
+    def __init__(self, client, bucket: str, key: str, part_size: int, concurrency: int, **extra_args):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = max(self.MIN_PART_SIZE, part_size)
+        self._concurrency = max(1, concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self._concurrency)
+        self._buffer = bytearray()
+        self._parts = []
+        self._futures = deque()
+        self._part_number = 0
+        self._upload_id = self._client.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)['UploadId']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.complete()
+        else:
+            self.abort()
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        while len(self._buffer) >= self._part_size:
+            self._upload_part(bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+        return len(data)
+
+    def complete(self):
+        try:
+            # upload the remaining (or only, possibly empty) part
+            if self._buffer or not self._part_number:
+                self._upload_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._futures:
+                self._parts.append(self._futures.popleft().result())
+            self._executor.shutdown()
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket, Key=self._key, UploadId=self._upload_id, MultipartUpload={'Parts': self._parts})
+        except BaseException:
+            # don't leave the (billable) uploaded parts behind when a part or the completion fails
+            self.abort()
+            raise
+
+    def abort(self):
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown()
+        self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+
+    def _upload_part(self, data: bytes):
+        if self._part_number >= self.MAX_PARTS:
+            raise IOError('Exceeded the maximum number of parts uploading {} (increase CWWED_ARCHIVE_UPLOAD_PART_BYTES)'.format(self._key))
+        # wait for the oldest part once the maximum number of parts are in flight
+        if len(self._futures) >= self._concurrency:
+            self._parts.append(self._futures.popleft().result())
+        self._part_number += 1
+        self._futures.append(self._executor.submit(self._put_part, self._part_number, data))
+
+    def _put_part(self, part_number: int, data: bytes) -> dict:
+        response = self._client.upload_part(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id, PartNumber=part_number, Body=data)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
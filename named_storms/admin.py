@@ -1,7 +1,7 @@
 from django.contrib.gis import admin
 from named_storms.models import (
     NamedStorm, CoveredData, CoveredDataProvider, NamedStormCoveredData, NSEM,
-    NamedStormCoveredDataLog,
+    NamedStormCoveredDataLog, NamedStormCoveredDataCollection, NamedStormCoveredDataCollectionItem,
 )
 
 
@@ -32,7 +32,7 @@ class NamedStormInlineAdmin(admin.GeoModelAdmin):
 
 @admin.register(CoveredData)
 class CoveredDataAdmin(admin.GeoModelAdmin):
-    list_display = ('id', 'name', 'active', 'url',)
+    list_display = ('id', 'name', 'active', 'url', 'provider_policy',)
     inlines = (
         NamedStormCoveredDataProviderInline,
     )
@@ -62,3 +62,21 @@ class DataLogAdmin(admin.ModelAdmin):
     list_display = ('named_storm', 'covered_data', 'date', 'success', 'snapshot',)
     list_filter = ('named_storm', 'covered_data', 'date', 'success',)
     readonly_fields = ('date',)  # hidden by default since it uses auto_now_add
+
+
+class NamedStormCoveredDataCollectionItemInline(admin.TabularInline):
+    model = NamedStormCoveredDataCollectionItem
+    show_change_link = True
+    extra = 0
+    fields = ('url', 'status', 'size_estimate', 'exception', 'date_updated',)
+    readonly_fields = ('date_updated',)
+
+
+@admin.register(NamedStormCoveredDataCollection)
+class NamedStormCoveredDataCollectionAdmin(admin.ModelAdmin):
+    list_display = ('named_storm', 'covered_data', 'provider', 'status', 'date_created', 'date_completed',)
+    list_filter = ('named_storm', 'covered_data', 'status', 'date_created',)
+    readonly_fields = ('date_created',)  # hidden by default since it uses auto_now_add
+    inlines = (
+        NamedStormCoveredDataCollectionItemInline,
+    )
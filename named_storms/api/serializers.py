@@ -3,7 +3,7 @@ from django.conf import settings
 from rest_framework import serializers
 
 from cwwed.storage_backends import S3ObjectStoragePrivate
-from named_storms.models import NamedStorm, NamedStormCoveredData, CoveredData, NSEM, CoveredDataProvider
+from named_storms.models import NamedStorm, NamedStormCoveredData, CoveredData, NSEM, CoveredDataProvider, NamedStormCoveredDataLog
 from named_storms.utils import get_opendap_url_nsem, get_opendap_url_nsem_covered_data, get_opendap_url_nsem_psa
 
 
@@ -48,6 +48,16 @@ class NamedStormCoveredDataSerializer(serializers.ModelSerializer):
         depth = 1
 
 
+class NamedStormCoveredDataSnapshotSerializer(serializers.ModelSerializer):
+    """
+    Successful covered data collection and its archived snapshot
+    """
+
+    class Meta:
+        model = NamedStormCoveredDataLog
+        fields = ('id', 'named_storm', 'covered_data', 'provider', 'date', 'snapshot')
+
+
 class NSEMSerializer(serializers.ModelSerializer):
     """
     Named Storm Event Model Serializer
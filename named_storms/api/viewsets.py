@@ -1,14 +1,22 @@
+import os
+import json
+import mimetypes
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
 from rest_framework.response import Response
 
+from cwwed.storage_backends import S3ObjectStoragePrivate
+from named_storms.archive import archive_index_path, member_data
 from named_storms.tasks import (
     archive_nsem_covered_data_task, extract_nsem_model_output_task, email_nsem_covered_data_complete_task,
     extract_nsem_covered_data_task,
 )
-from named_storms.models import NamedStorm, CoveredData, NSEM
-from named_storms.api.serializers import NamedStormSerializer, CoveredDataSerializer, NamedStormDetailSerializer, NSEMSerializer
+from named_storms.models import NamedStorm, CoveredData, NSEM, NamedStormCoveredDataLog
+from named_storms.api.serializers import (
+    NamedStormSerializer, CoveredDataSerializer, NamedStormDetailSerializer, NSEMSerializer, NamedStormCoveredDataSnapshotSerializer,
+)
 
 
 class NamedStormViewSet(viewsets.ReadOnlyModelViewSet):
@@ -29,6 +37,51 @@ class CoveredDataViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CoveredDataSerializer
 
 
+class NamedStormCoveredDataSnapshotViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Archived covered data snapshots.
+    Their contents are listed and single files are downloaded (with a ranged request) using each archive's index
+    so the whole snapshot never needs to be retrieved.
+    """
+    queryset = NamedStormCoveredDataLog.objects.filter(success=True).exclude(snapshot='').order_by('-date')
+    serializer_class = NamedStormCoveredDataSnapshotSerializer
+    filter_fields = ('named_storm__id', 'covered_data__id')
+
+    @action(methods=['get'], detail=True)
+    def contents(self, request, pk=None):
+        index = self._index(self.get_object())
+        return Response([
+            {'name': member['name'], 'size': member['size'], 'mtime': member['mtime']} for member in index['members']
+        ])
+
+    @action(methods=['get'], detail=True)
+    def download(self, request, pk=None):
+        # i.e ?name=Physical/station-8454000-water_level-MLLW.xml
+        log = self.get_object()
+        index = self._index(log)
+        member = next((m for m in index['members'] if m['name'] == request.query_params.get('name')), None)
+        if member is None:
+            raise Http404('{} is not in the snapshot'.format(request.query_params.get('name')))
+
+        chunks = S3ObjectStoragePrivate().read_range(log.snapshot, member['offset'], member['length'])
+        content_type, _ = mimetypes.guess_type(member['name'])
+        response = StreamingHttpResponse(
+            member_data(chunks, member, index['compression']), content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = member['size']
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(os.path.basename(member['name']))
+        return response
+
+    @staticmethod
+    def _index(log: NamedStormCoveredDataLog) -> dict:
+        storage = S3ObjectStoragePrivate()
+        index_path = archive_index_path(log.snapshot)
+        # snapshots archived before indexes were introduced
+        if not storage.exists(index_path):
+            raise Http404('The snapshot has no index')
+        with storage.open(index_path) as f:
+            return json.loads(f.read().decode())
+
+
 class NSEMViewset(viewsets.ModelViewSet):
     """
     Named Storm Event Model Viewset
@@ -0,0 +1,431 @@
+"""
+Parallel archive compression.
+
+Archives are written as an uncompressed tar stream through a writer which compresses fixed size blocks as independent
+frames on a thread pool (zlib and zstd release the GIL) and writes them in order:
+    - gzip: each frame is a gzip member.  Concatenated members are still a standard gzip stream (gunzip, tarfile "r:gz" etc.)
+    - zstd: each frame is a zstd frame (optional dependency).  Concatenated frames are still a standard zstd stream.
+Every frame records its own compressed size (in the gzip member's "extra" field or a preceding zstd skippable frame)
+so a reader can locate the frames and decompress them in parallel too.
+
+Archives without recorded frame sizes (i.e uploaded PSAs) are decompressed on a background thread so decompression
+still overlaps with extracting the files.
+
+Archives written by `write_archive` also start a new frame at every file so each file can be decompressed on its own.
+A sidecar index records every file's compressed byte range so a single file can be retrieved from object storage with
+one ranged request.
+"""
+import os
+import gzip
+import queue
+import struct
+import tarfile
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+
+ARCHIVE_EXTENSIONS = {
+    COMPRESSION_GZIP: 'tgz',
+    COMPRESSION_ZSTD: 'tar.zst',
+}
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# gzip header (magic, deflate, FEXTRA flag, no mtime, unknown os) followed by an "extra" field holding a single
+# "CW" subfield with the member's total compressed size
+GZIP_MEMBER_HEADER = struct.Struct('<2sBBIBBH2sHI')
+GZIP_MEMBER_TRAILER = struct.Struct('<II')
+GZIP_FLAG_EXTRA = 4
+GZIP_OS_UNKNOWN = 255
+MEMBER_SIZE_SUBFIELD = b'CW'
+
+# zstd skippable frame (magic, length) holding the total compressed size of itself and the following frame
+ZSTD_SKIPPABLE_FRAME = struct.Struct('<III')
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A5C
+
+FRAME_HEADER_SIZES = {
+    COMPRESSION_GZIP: GZIP_MEMBER_HEADER.size,
+    COMPRESSION_ZSTD: ZSTD_SKIPPABLE_FRAME.size,
+}
+
+READ_SIZE = 1024 * 1024
+
+# tar pads every file's data to a multiple of its block size
+TAR_BLOCK_SIZE = 512
+
+
+def archive_extension(compression: str = None) -> str:
+    return ARCHIVE_EXTENSIONS[compression or settings.CWWED_ARCHIVE_COMPRESSION]
+
+
+def archive_index_path(archive_path: str) -> str:
+    return '{}.{}'.format(archive_path, settings.CWWED_ARCHIVE_INDEX_EXTENSION)
+
+
+def write_archive(fileobj, path: str, arcname: str, compression: str = None) -> dict:
+    """
+    Writes a compressed tar of the path into `fileobj` (which it doesn't close), starting a new frame at every file
+    :return: index of the archive's files, i.e {"compression": "gzip", "members": [{"name": ..., "offset": ...}, ...]}
+        - size: size of the file's data
+        - mtime: modification time of the file
+        - offset: start of the file's frames in the compressed archive
+        - length: compressed length of the file's frames
+        - data_offset: start of the file's data within its decompressed frames (i.e after its tar header)
+    """
+    compression = compression or settings.CWWED_ARCHIVE_COMPRESSION
+    members = []
+    with archive_writer(fileobj, compression) as compressed:
+        with tarfile.open(fileobj=compressed, mode='w') as tar:
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                # directories are added as they're walked (except symbolic links which aren't followed)
+                names = [root] + [os.path.join(root, d) for d in dirs if os.path.islink(os.path.join(root, d))]
+                for name in names + [os.path.join(root, f) for f in sorted(files)]:
+                    tarinfo = tar.gettarinfo(name, os.path.normpath(os.path.join(arcname, os.path.relpath(name, path))))
+                    if not tarinfo.isreg():
+                        tar.addfile(tarinfo)
+                        continue
+                    frame_start = compressed.flush_frame()
+                    position = compressed.tell()
+                    with open(name, 'rb') as f:
+                        tar.addfile(tarinfo, f)
+                    frame_end = compressed.flush_frame()
+                    padding = (TAR_BLOCK_SIZE - tarinfo.size % TAR_BLOCK_SIZE) % TAR_BLOCK_SIZE
+                    members.append({
+                        'name': tarinfo.name,
+                        'size': tarinfo.size,
+                        'mtime': tarinfo.mtime,
+                        'frames': (frame_start, frame_end),
+                        'data_offset': compressed.tell() - position - tarinfo.size - padding,
+                    })
+
+    # the frames' compressed offsets are only known once everything is written
+    for member in members:
+        frame_start, frame_end = member.pop('frames')
+        member['offset'] = compressed.offset(frame_start)
+        member['length'] = compressed.offset(frame_end) - member['offset']
+
+    return {
+        'compression': compression,
+        'members': members,
+    }
+
+
+def member_data(chunks, member: dict, compression: str):
+    """
+    Decompresses a single file's frames (i.e the body of a ranged request for its compressed byte range)
+    :return: generator of the file's data
+    """
+    remaining_offset = member['data_offset']
+    remaining_size = member['size']
+    for chunk in _decompress_frames(chunks, compression):
+        if remaining_offset:
+            skipped = min(remaining_offset, len(chunk))
+            chunk = chunk[skipped:]
+            remaining_offset -= skipped
+        chunk = chunk[:remaining_size]
+        remaining_size -= len(chunk)
+        if chunk:
+            yield chunk
+        if not remaining_size:
+            return
+
+
+def archive_writer(fileobj, compression: str = None):
+    """
+    :return: writable stream which compresses everything written to it into `fileobj` (which it doesn't close)
+    """
+    compression = compression or settings.CWWED_ARCHIVE_COMPRESSION
+    if compression == COMPRESSION_GZIP:
+        compress_frame = partial(gzip_frame, level=settings.CWWED_ARCHIVE_COMPRESSION_LEVEL)
+    elif compression == COMPRESSION_ZSTD:
+        _zstandard()
+        compress_frame = partial(zstd_frame, level=settings.CWWED_ARCHIVE_COMPRESSION_LEVEL)
+    else:
+        raise ImproperlyConfigured('Unknown archive compression: {}'.format(compression))
+    return ParallelFrameWriter(
+        fileobj,
+        compress_frame=compress_frame,
+        block_size=settings.CWWED_ARCHIVE_COMPRESSION_BLOCK_BYTES,
+        threads=settings.CWWED_ARCHIVE_COMPRESSION_THREADS,
+    )
+
+
+def archive_reader(path: str):
+    """
+    :return: readable stream of the decompressed archive (the compression is determined by its contents)
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return ParallelFrameReader(path, COMPRESSION_GZIP, threads=settings.CWWED_ARCHIVE_EXTRACT_THREADS)
+    elif magic in (ZSTD_MAGIC, struct.pack('<I', ZSTD_SKIPPABLE_MAGIC)):
+        return ParallelFrameReader(path, COMPRESSION_ZSTD, threads=settings.CWWED_ARCHIVE_EXTRACT_THREADS)
+    raise IOError('Unknown archive compression: {}'.format(path))
+
+
+def gzip_frame(data: bytes, level: int) -> bytes:
+    """
+    :return: a complete gzip member (recording its own compressed size) of the data
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    size = GZIP_MEMBER_HEADER.size + len(deflated) + GZIP_MEMBER_TRAILER.size
+    header = GZIP_MEMBER_HEADER.pack(
+        GZIP_MAGIC, zlib.DEFLATED, GZIP_FLAG_EXTRA, 0, 0, GZIP_OS_UNKNOWN, 8, MEMBER_SIZE_SUBFIELD, 4, size)
+    trailer = GZIP_MEMBER_TRAILER.pack(zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+    return header + deflated + trailer
+
+
+def zstd_frame(data: bytes, level: int) -> bytes:
+    """
+    :return: a zstd frame of the data preceded by a skippable frame recording their compressed size
+    """
+    frame = _zstandard().ZstdCompressor(level=level).compress(data)
+    return ZSTD_SKIPPABLE_FRAME.pack(ZSTD_SKIPPABLE_MAGIC, 4, ZSTD_SKIPPABLE_FRAME.size + len(frame)) + frame
+
+
+def frame_size(header: bytes, compression: str):
+    """
+    :param header: the first bytes of a frame
+    :return: the frame's total compressed size recorded in its header, or None if it wasn't written by `gzip_frame`/`zstd_frame`
+    """
+    if len(header) < FRAME_HEADER_SIZES[compression]:
+        return None
+    if compression == COMPRESSION_GZIP:
+        magic, method, flags, _, _, _, extra_length, subfield, subfield_length, size = GZIP_MEMBER_HEADER.unpack(
+            header[:GZIP_MEMBER_HEADER.size])
+        if (magic, method, flags, extra_length, subfield, subfield_length) != (GZIP_MAGIC, zlib.DEFLATED, GZIP_FLAG_EXTRA, 8, MEMBER_SIZE_SUBFIELD, 4):
+            return None
+        return size
+    magic, length, size = ZSTD_SKIPPABLE_FRAME.unpack(header[:ZSTD_SKIPPABLE_FRAME.size])
+    if (magic, length) != (ZSTD_SKIPPABLE_MAGIC, 4):
+        return None
+    return size
+
+
+def decompress_frame(frame: bytes, compression: str) -> bytes:
+    if compression == COMPRESSION_GZIP:
+        return zlib.decompress(frame, 16 + zlib.MAX_WBITS)
+    return _zstandard().ZstdDecompressor().decompress(frame[ZSTD_SKIPPABLE_FRAME.size:])
+
+
+class ParallelFrameWriter:
+    """
+    Compresses blocks as independent frames on a thread pool and writes them to the underlying stream in order.
+    Writes block once twice the number of threads are being compressed so memory is bounded.
+    """
+
+    def __init__(self, fileobj, compress_frame, block_size: int, threads: int):
+        self._fileobj = fileobj
+        self._compress_frame = compress_frame
+        self._block_size = block_size
+        self._threads = max(1, threads)
+        self._executor = ThreadPoolExecutor(max_workers=self._threads)
+        self._buffer = bytearray()
+        self._futures = deque()
+        self._frames = 0
+        self._position = 0
+        # compressed offset of every frame written (and the end of the last one)
+        self._offsets = [0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown()
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        self._position += len(data)
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return len(data)
+
+    def tell(self) -> int:
+        # uncompressed position
+        return self._position
+
+    def flush_frame(self) -> int:
+        """
+        Compresses anything buffered so the next write starts a new frame
+        :return: number of the next frame
+        """
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        return self._frames
+
+    def offset(self, frame: int) -> int:
+        # compressed offset of a frame (once written)
+        return self._offsets[frame]
+
+    def close(self):
+        # always write at least one frame so the output is a valid stream
+        if self._buffer or not self._frames:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._futures:
+            self._write_frame(self._futures.popleft().result())
+        self._executor.shutdown()
+
+    def _submit(self, block: bytes):
+        if len(self._futures) >= 2 * self._threads:
+            self._write_frame(self._futures.popleft().result())
+        self._futures.append(self._executor.submit(self._compress_frame, block))
+        self._frames += 1
+
+    def _write_frame(self, frame: bytes):
+        self._fileobj.write(frame)
+        self._offsets.append(self._offsets[-1] + len(frame))
+
+
+class DecompressedReader:
+    """
+    Readable stream (i.e for a streaming tarfile) over decompressed chunks which are produced on a background thread
+    """
+
+    def __init__(self, chunks, depth: int = 8):
+        self._queue = queue.Queue(maxsize=depth)
+        self._buffer = bytearray()
+        self._eof = False
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._queue.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer.extend(chunk)
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        # stop the producer (which may be blocked on a full queue)
+        self._closed.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=.1)
+            except queue.Empty:
+                pass
+
+    def _produce(self, chunks):
+        try:
+            for chunk in chunks:
+                if self._closed.is_set():
+                    return
+                self._queue.put(chunk)
+            self._queue.put(None)
+        except Exception as e:
+            self._queue.put(e)
+
+
+class ParallelFrameReader(DecompressedReader):
+    """
+    Decompresses the frames written by `ParallelFrameWriter` on a thread pool (in order), falling back to sequential
+    decompression at the first frame which doesn't record its size (i.e any other gzip/zstd)
+    """
+
+    def __init__(self, path: str, compression: str, threads: int):
+        self._path = path
+        self._compression = compression
+        self._threads = max(1, threads)
+        super().__init__(self._chunks(), depth=2 * self._threads)
+
+    def _chunks(self):
+        with open(self._path, 'rb') as f, ThreadPoolExecutor(max_workers=self._threads) as executor:
+            futures = deque()
+            while True:
+                offset = f.tell()
+                header = f.read(FRAME_HEADER_SIZES[self._compression])
+                if not header:
+                    break
+                size = frame_size(header, self._compression) if self._threads > 1 else None
+                if size is None:
+                    f.seek(offset)
+                    break
+                frame = header + f.read(size - len(header))
+                futures.append(executor.submit(decompress_frame, frame, self._compression))
+                if len(futures) >= 2 * self._threads:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+            # decompress anything remaining sequentially
+            if self._compression == COMPRESSION_GZIP:
+                with gzip.GzipFile(fileobj=f) as remaining:
+                    for chunk in iter(lambda: remaining.read(READ_SIZE), b''):
+                        yield chunk
+            else:
+                for chunk in self._zstd_chunks(f):
+                    yield chunk
+
+    def _zstd_chunks(self, f):
+        # decompress the remaining frames one after another, skipping our size frames
+        decompressor = _zstandard().ZstdDecompressor()
+        while True:
+            header = f.read(FRAME_HEADER_SIZES[COMPRESSION_ZSTD])
+            if not header:
+                return
+            size = frame_size(header, COMPRESSION_ZSTD)
+            if size is not None:
+                yield decompress_frame(header + f.read(size - len(header)), COMPRESSION_ZSTD)
+                continue
+            # any other zstd stream (i.e a single frame written by another tool)
+            f.seek(-len(header), os.SEEK_CUR)
+            for chunk in decompressor.read_to_iter(f, read_size=READ_SIZE):
+                yield chunk
+            return
+
+
+def _decompress_frames(chunks, compression: str):
+    """
+    Decompresses a stream of complete frames (written by `ParallelFrameWriter`) as each frame arrives
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while True:
+            size = frame_size(bytes(buffer[:FRAME_HEADER_SIZES[compression]]), compression)
+            if size is None or len(buffer) < size:
+                break
+            yield decompress_frame(bytes(buffer[:size]), compression)
+            del buffer[:size]
+    if buffer:
+        raise IOError('Incomplete or unknown {} frames'.format(compression))
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured('The "zstandard" package is required for zstd archives')
+    return zstandard
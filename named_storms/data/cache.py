@@ -0,0 +1,228 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import logging
+import tempfile
+from django.conf import settings
+from named_storms.data.locks import FileLock
+from named_storms.data.manifest import file_hash
+from named_storms.utils import create_directory
+
+# linux ioctl to reflink (copy-on-write clone) a file, i.e on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def clone_file(source: str, destination: str, link: bool = True):
+    """
+    Hard-links the source to the destination, falling back to a reflink and then to a plain copy (i.e across devices)
+    :param link: whether a hard-link is acceptable (i.e not when the destination will be modified)
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class DownloadCache:
+    """
+    Content addressed cache of upstream downloads shared by every storm.
+
+    Objects are stored by their sha256 and an index entry (keyed by the url) records the upstream validators
+    (ETag/Last-Modified) the object was downloaded with, so overlapping storms can link the same upstream file
+    instead of downloading it again.  The cache is capped in size and the least recently used objects are evicted.
+    A running total of the objects' sizes is kept in a ledger so the objects are only walked once the cap is exceeded.
+
+    The cache lives on the data volume so objects can be hard-linked into the storms' staging directories.
+    """
+    OBJECTS_DIR_NAME = 'objects'
+    INDEX_DIR_NAME = 'index'
+    LOCK_FILE_NAME = '.lock'
+    LEDGER_FILE_NAME = 'ledger.json'
+
+    _root: str = None
+    _max_bytes: int = None
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self._root = root or settings.CWWED_DOWNLOAD_CACHE_DIR
+        self._max_bytes = settings.CWWED_DOWNLOAD_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.CWWED_DOWNLOAD_CACHE_MAX_BYTES > 0
+
+    def get(self, url: str, destination: str, etag: str = None, last_modified: str = None) -> bool:
+        """
+        Links the cached object for the url into the destination if the upstream validators match
+        :return: whether the destination was populated from the cache
+        """
+        # we can't determine if the cached object is current without upstream validators
+        if not any([etag, last_modified]):
+            return False
+
+        entry = self._read_entry(url)
+        if entry is None or entry.get('etag') != etag or entry.get('last_modified') != last_modified:
+            return False
+
+        object_path = self._object_path(entry['hash'])
+        if not os.path.exists(object_path) or os.path.getsize(object_path) != entry['size']:
+            return False
+
+        clone_file(object_path, destination)
+
+        # mark the object as recently used
+        os.utime(object_path)
+
+        logging.info('Using cached download for {}'.format(url))
+
+        return True
+
+    def add(self, url: str, path: str, etag: str = None, last_modified: str = None):
+        """
+        Adds a downloaded file to the cache (linking it rather than copying when possible) and evicts old objects if necessary
+        """
+        if not any([etag, last_modified]):
+            return
+
+        content_hash = file_hash(path)
+        object_path = self._object_path(content_hash)
+        create_directory(os.path.dirname(object_path))
+
+        # link via a temporary path and atomically move it in place so readers never see a partial object
+        size = os.path.getsize(path)
+        if not os.path.exists(object_path):
+            tmp_path = self._temporary_path(object_path)
+            clone_file(path, tmp_path)
+            os.utime(tmp_path)
+            with self._lock():
+                if os.path.exists(object_path):
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, object_path)
+                    # only evict once the running total exceeds the cap
+                    if self._add_to_ledger(size) > self._max_bytes:
+                        self._evict()
+        else:
+            os.utime(object_path)
+
+        self._write_entry(url, {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'size': size,
+            'hash': content_hash,
+        })
+
+    def evict(self):
+        """
+        Removes the least recently used objects (and their index entries) until the cache is within its size cap
+        """
+        with self._lock():
+            self._evict()
+
+    def _evict(self):
+        # the caller must hold the lock
+        objects = []
+        for dir_path, _, file_names in os.walk(os.path.join(self._root, self.OBJECTS_DIR_NAME)):
+            for file_name in file_names:
+                # skip objects which are still being added
+                if file_name.startswith('.'):
+                    continue
+                stat = os.stat(os.path.join(dir_path, file_name))
+                objects.append((stat.st_mtime, stat.st_size, file_name, os.path.join(dir_path, file_name)))
+
+        # the walk also corrects any drift in the ledger (i.e objects removed by hand)
+        total = sum(o[1] for o in objects)
+
+        evicted = set()
+        for _, size, content_hash, object_path in sorted(objects):
+            if total <= self._max_bytes:
+                break
+            os.remove(object_path)
+            evicted.add(content_hash)
+            total -= size
+
+        self._write_ledger(total)
+
+        if not evicted:
+            return
+
+        # remove index entries referencing evicted objects
+        index_path = os.path.join(self._root, self.INDEX_DIR_NAME)
+        for file_name in os.listdir(index_path):
+            entry = self._load_json(os.path.join(index_path, file_name))
+            if entry is None or entry['hash'] in evicted:
+                os.remove(os.path.join(index_path, file_name))
+
+        logging.info('Evicted {} objects from the download cache'.format(len(evicted)))
+
+    def _add_to_ledger(self, size: int) -> int:
+        """
+        Adds an object's size to the running total (the caller must hold the lock)
+        :return: the new total, or infinity when there's no ledger yet so the first eviction walk builds it
+        """
+        ledger = self._load_json(self._ledger_path())
+        if ledger is None:
+            return float('inf')
+        total = ledger['total_bytes'] + size
+        self._write_ledger(total)
+        return total
+
+    def _write_ledger(self, total: int):
+        ledger_path = self._ledger_path()
+        tmp_path = self._temporary_path(ledger_path)
+        with open(tmp_path, 'w') as f:
+            json.dump({'total_bytes': total}, f)
+        os.replace(tmp_path, ledger_path)
+
+    def _ledger_path(self) -> str:
+        return os.path.join(self._root, self.LEDGER_FILE_NAME)
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self._root, self.OBJECTS_DIR_NAME, content_hash[:2], content_hash)
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self._root, self.INDEX_DIR_NAME, '{}.json'.format(hashlib.sha1(url.encode()).hexdigest()))
+
+    def _read_entry(self, url: str) -> dict:
+        return self._load_json(self._entry_path(url))
+
+    def _write_entry(self, url: str, entry: dict):
+        entry_path = self._entry_path(url)
+        create_directory(os.path.dirname(entry_path))
+        tmp_path = self._temporary_path(entry_path)
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, entry_path)
+
+    @staticmethod
+    def _temporary_path(path: str) -> str:
+        """
+        :return: a unique temporary path (across processes, threads and greenlets) beside the path
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.{}.'.format(os.path.basename(path)))
+        os.close(fd)
+        return tmp_path
+
+    @staticmethod
+    def _load_json(path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _lock(self):
+        return FileLock(os.path.join(create_directory(self._root), self.LOCK_FILE_NAME))
+
@@ -0,0 +1,155 @@
+"""
+Worker (process) level registry of connections shared by every processor and factory:
+    - keep-alive http sessions per host (and ssl verification) with sized connection pools and retries on connection failures
+    - pools of logged-in ftp control connections per host
+Every request (and ftp connection) is paced by the process' throttle for the host which syncs with every other worker.
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from ftplib import FTP, error_temp, all_errors as ftp_errors
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from django.conf import settings
+from named_storms.data.throttle import HostThrottle, THROTTLED_STATUS_CODES, host_throttle, retry_after_seconds
+
+_lock = threading.Lock()
+_pid = None
+_http_sessions = {}
+_ftp_connections = {}
+
+
+def _registry_reset_after_fork():
+    # connections can't be shared with forked (i.e celery prefork) processes so start with a clean registry per process
+    global _pid, _http_sessions, _ftp_connections
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _http_sessions = {}
+        _ftp_connections = {}
+
+
+def http_session(url: str, verify=True) -> requests.Session:
+    """
+    :return: the process' shared session for the url's host
+    """
+    key = (urlparse(url).netloc, verify)
+    with _lock:
+        _registry_reset_after_fork()
+        if key not in _http_sessions:
+            _http_sessions[key] = _create_http_session(verify)
+        return _http_sessions[key]
+
+
+def _create_http_session(verify: bool) -> requests.Session:
+    session = requests.Session()
+    session.verify = verify
+
+    # retry connection failures and gateway errors (returning the final response vs raising so callers can inspect it)
+    retry = Retry(
+        total=settings.CWWED_HTTP_RETRIES,
+        backoff_factor=settings.CWWED_HTTP_RETRY_BACKOFF,
+        status_forcelist=(502, 504),
+        raise_on_status=False,
+    )
+    adapter = ThrottledHTTPAdapter(pool_connections=1, pool_maxsize=settings.CWWED_HTTP_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+class ThrottledHTTPAdapter(HTTPAdapter):
+    """
+    Paces requests through the host's throttle and reports how the host responded so the rate adapts.
+    Throttled (429/503) responses are retried here once the throttle allows it rather than failing the task.
+    """
+
+    def send(self, request, **kwargs):
+        if not HostThrottle.enabled():
+            return super().send(request, **kwargs)
+
+        throttle = host_throttle(urlparse(request.url).netloc)
+        attempt = 0
+        while True:
+            throttle.acquire()
+            response = super().send(request, **kwargs)
+            if response.status_code not in THROTTLED_STATUS_CODES:
+                throttle.succeeded()
+                return response
+            throttle.throttled(retry_after_seconds(response.headers.get('Retry-After')))
+            attempt += 1
+            if attempt > settings.CWWED_THROTTLE_RETRIES:
+                return response
+            response.close()
+
+
+@contextmanager
+def ftp_connection(host: str) -> FTP:
+    """
+    Borrows a logged-in ftp control connection for the host from the pool, and returns it to the pool when finished.
+    Connections which raise an error aren't returned to the pool since their state is unknown.
+    """
+    throttle = host_throttle(host) if HostThrottle.enabled() else None
+    if throttle is not None:
+        throttle.acquire()
+    try:
+        ftp = _borrow_ftp_connection(host)
+    except error_temp as e:
+        _report_ftp_error(throttle, e)
+        raise
+    try:
+        yield ftp
+    except Exception as e:
+        _close_ftp_connection(ftp)
+        _report_ftp_error(throttle, e)
+        raise
+    else:
+        _return_ftp_connection(host, ftp)
+
+
+def _report_ftp_error(throttle: HostThrottle, e: Exception):
+    # i.e "421 Too many connections"
+    if throttle is not None and isinstance(e, error_temp) and str(e).startswith('421'):
+        throttle.throttled()
+
+
+def _borrow_ftp_connection(host: str) -> FTP:
+    while True:
+        with _lock:
+            _registry_reset_after_fork()
+            idle = _ftp_connections.setdefault(host, [])
+            ftp = idle.pop() if idle else None
+
+        if ftp is None:
+            ftp = FTP(host, timeout=settings.CWWED_FTP_TIMEOUT)
+            ftp.login()
+            return ftp
+
+        # verify the idle connection is still alive (servers drop idle control connections)
+        try:
+            ftp.voidcmd('NOOP')
+            return ftp
+        except ftp_errors:
+            _close_ftp_connection(ftp)
+
+
+def _return_ftp_connection(host: str, ftp: FTP):
+    with _lock:
+        idle = _ftp_connections.setdefault(host, [])
+        if len(idle) < settings.CWWED_FTP_POOL_SIZE:
+            idle.append(ftp)
+            return
+    _close_ftp_connection(ftp)
+
+
+def _close_ftp_connection(ftp: FTP):
+    try:
+        ftp.quit()
+    except ftp_errors:
+        ftp.close()
+    except Exception as e:
+        logging.warning('Could not close ftp connection: {}'.format(e))
+        ftp.close()
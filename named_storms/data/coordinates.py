@@ -0,0 +1,58 @@
+from typing import List
+import numpy
+
+
+def index_slice(values: numpy.ndarray, start: float, end: float) -> slice:
+    """
+    Returns the (inclusive) index range of values between start and end using a binary search.
+    Supports ascending and descending (i.e latitudes from north to south) coordinates.
+    :param values: sorted coordinate values
+    :return: slice which is empty if nothing is in range
+    """
+    values = numpy.asarray(values)
+    size = len(values)
+
+    if size == 0:
+        return slice(0, 0)
+
+    # search the reversed (ascending) values and flip the indexes back
+    if size > 1 and values[0] > values[-1]:
+        ascending = values[::-1]
+        idx_start = numpy.searchsorted(ascending, start, side='left')
+        idx_end = numpy.searchsorted(ascending, end, side='right')
+        return slice(int(size - idx_end), int(size - idx_start))
+
+    idx_start = numpy.searchsorted(values, start, side='left')
+    idx_end = numpy.searchsorted(values, end, side='right')
+    return slice(int(idx_start), int(idx_end))
+
+
+def longitude_slices(values: numpy.ndarray, start: float, end: float) -> List[slice]:
+    """
+    Returns the index ranges of longitudes between start and end (in "degrees_east", i.e 0-360).
+    The range is converted to the coordinate's own convention (0-360 or -180-180) and, when it crosses
+    the coordinate's seam, it's split into two ranges so each can be requested server side.
+    :param values: sorted longitude values
+    :return: list of non-empty slices
+    """
+    values = numpy.asarray(values)
+
+    if len(values) and values.min() < 0:
+        # convert to -180-180
+        start = (start + 180) % 360 - 180
+        end = (end + 180) % 360 - 180
+    else:
+        # convert to 0-360
+        start = start % 360
+        end = end % 360
+
+    if start <= end:
+        slices = [index_slice(values, start, end)]
+    else:
+        # the range wraps around the seam, i.e 350-10, so split it into the two ends of the coordinate
+        slices = [
+            index_slice(values, start, numpy.inf),
+            index_slice(values, -numpy.inf, end),
+        ]
+
+    return [s for s in slices if s.stop > s.start]
@@ -2,8 +2,7 @@ import os
 import re
 import celery
 import pytz
-import requests
-from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor
 from functools import cmp_to_key
 from datetime import datetime, timedelta
 from django.conf import settings
@@ -12,11 +11,15 @@ from lxml import etree
 from typing import List
 from io import BytesIO
 from urllib import parse
+from named_storms.data import scratch
+from named_storms.data.connections import http_session, ftp_connection
 from named_storms.data.decorators import register_factory
+from named_storms.data.manifest import CoveredDataManifest
 from named_storms import tasks
 from named_storms.data.processors import ProcessorData
 from named_storms import models as storm_models
 from named_storms.models import CoveredDataProvider, NamedStorm, NamedStormCoveredData
+from named_storms.utils import named_storm_covered_data_archive_path
 
 
 class ProcessorBaseFactory:
@@ -56,7 +59,51 @@ class ProcessorCoreFactory(ProcessorBaseFactory):
 
     def processors_data(self) -> List[ProcessorData]:
         self._verify_registered()
-        return self._processors_data()
+        processors_data = self._processors_data()
+        if settings.CWWED_ESTIMATE_DATASET_SIZES:
+            processors_data = self._estimate_sizes(processors_data)
+        return processors_data
+
+    def _estimate_sizes(self, processors_data: List[ProcessorData]) -> List[ProcessorData]:
+        """
+        Estimates the size of every dataset (which doesn't already have one, i.e from the catalog) so the largest can be scheduled first.
+        The size is taken from the previous collection's manifest, otherwise from the upstream (HEAD/SIZE).
+        """
+        manifest = CoveredDataManifest.load(named_storm_covered_data_archive_path(self._named_storm, self._provider.covered_data))
+
+        def estimate(processor_data: ProcessorData) -> ProcessorData:
+            if processor_data.size is not None:
+                return processor_data
+            entry = manifest.get(processor_data.url)
+            if entry and entry.get('size') is not None:
+                return processor_data._replace(size=entry['size'])
+            return processor_data._replace(size=self._upstream_size(processor_data.url))
+
+        with ThreadPoolExecutor(max_workers=settings.CWWED_ESTIMATE_DATASET_SIZES_CONCURRENCY) as executor:
+            return list(executor.map(estimate, processors_data))
+
+    def _upstream_size(self, url: str):
+        """
+        :return: the upstream size in bytes or None if it's unknown
+        """
+        # the size of a (remote) opendap subset can't be determined up front
+        if self._provider.processor_source == storm_models.PROCESSOR_DATA_SOURCE_DAP:
+            return None
+        try:
+            if url.startswith('ftp://'):
+                url_parsed = parse.urlparse(url)
+                with ftp_connection(url_parsed.hostname) as ftp:
+                    ftp.voidcmd('TYPE I')
+                    return ftp.size(url_parsed.path)
+            response = http_session(url, verify=self._verify_ssl).head(url, allow_redirects=True, timeout=10)
+            content_length = response.headers.get('Content-Length', '')
+            return int(content_length) if response.ok and content_length.isdigit() else None
+        except Exception:
+            return None
+
+    def _get(self, url: str, **kwargs):
+        # fetch using the worker's shared session for the url's host
+        return http_session(url, verify=self._verify_ssl).get(url, **kwargs)
 
     @staticmethod
     def generic_filter(records: list):
@@ -93,12 +140,12 @@ class USGSProcessorFactory(ProcessorCoreFactory):
         processors_data = []
 
         # fetch deployment types
-        deployment_types_req = requests.get('https://stn.wim.usgs.gov/STNServices/DeploymentTypes.json', timeout=10)
+        deployment_types_req = self._get('https://stn.wim.usgs.gov/STNServices/DeploymentTypes.json', timeout=10)
         deployment_types_req.raise_for_status()
         self.deployment_types = deployment_types_req.json()
 
         # fetch event sensors
-        sensors_req = requests.get(
+        sensors_req = self._get(
             'https://stn.wim.usgs.gov/STNServices/Events/{}/Instruments.json'.format(self._named_storm_covered_data.external_storm_id),
             timeout=10,
         )
@@ -106,7 +153,7 @@ class USGSProcessorFactory(ProcessorCoreFactory):
         self.sensors = sensors_req.json()
 
         # fetch event data files
-        files_req = requests.get(
+        files_req = self._get(
             'https://stn.wim.usgs.gov/STNServices/Events/{}/Files.json'.format(self._named_storm_covered_data.external_storm_id),
             timeout=10,
         )
@@ -221,6 +268,28 @@ class THREDDSCatalogBaseFactory(ProcessorCoreFactory):
         'xlink': 'http://www.w3.org/1999/xlink',
     }
 
+    # catalog dataSize units
+    DATA_SIZE_UNITS = {
+        'bytes': 1,
+        'kbytes': 1024,
+        'mbytes': 1024 ** 2,
+        'gbytes': 1024 ** 3,
+        'tbytes': 1024 ** 4,
+    }
+
+    def _dataset_size(self, dataset: etree.Element):
+        """
+        :return: size in bytes from a catalog dataset's (optional) dataSize element, i.e <dataSize units="Mbytes">12.5</dataSize>
+        """
+        data_size = dataset.find('catalog:dataSize', namespaces=self.namespaces)
+        if data_size is None:
+            return None
+        units = self.DATA_SIZE_UNITS.get((data_size.get('units') or 'bytes').lower())
+        try:
+            return int(float(data_size.text) * units) if units else None
+        except (TypeError, ValueError):
+            return None
+
     def _catalog_ref_title(self, catalog_ref: etree.Element) -> str:
         """
         :return: title value for a particular catalogRef element
@@ -249,7 +318,7 @@ class THREDDSCatalogBaseFactory(ProcessorCoreFactory):
         """
 
         # fetch and parse the main catalog
-        catalog_response = requests.get(catalog_url, verify=self._verify_ssl, timeout=10)
+        catalog_response = self._get(catalog_url, timeout=10)
         catalog_response.raise_for_status()
         catalog = etree.parse(BytesIO(catalog_response.content))
 
@@ -264,8 +333,16 @@ class THREDDSCatalogBaseFactory(ProcessorCoreFactory):
         """
         task_group = celery.group([tasks.fetch_url_task.s(url, self._verify_ssl) for url in catalog_urls])
         task_promise = task_group()
-        catalogs = task_promise.get()
-        catalogs = [etree.parse(BytesIO(s.encode())) for s in catalogs]
+        # factories run inside the collection tasks so explicitly allow waiting on these sub tasks
+        results = task_promise.get(disable_sync_subtasks=False)
+        catalogs = []
+        for result in results:
+            # large catalogs are returned as references to the scratch store so parse them straight from disk
+            if scratch.is_reference(result):
+                catalogs.append(etree.parse(scratch.reference_path(result)))
+                scratch.remove(result)
+            else:
+                catalogs.append(etree.parse(BytesIO(result.encode())))
         return catalogs
 
 
@@ -352,13 +429,13 @@ class JPLProcessorBaseFactory(THREDDSCatalogBaseFactory):
         for catalog_document in catalog_documents:
             for dataset in catalog_document.xpath('//catalog:dataset', namespaces=self.namespaces):
                 if self._is_using_dataset(dataset.get('name')):
-                    dataset_paths.append(dataset.get('ID'))
+                    dataset_paths.append((dataset.get('ID'), self._dataset_size(dataset)))
 
         # filter datasets
         dataset_paths = self.generic_filter(dataset_paths)
 
         # build a list of processors for all the relevant datasets
-        for dataset_path in dataset_paths:
+        for dataset_path, dataset_size in dataset_paths:
             label = os.path.basename(dataset_path)
             url = '{}://{}/{}'.format(
                 self._provider_url_parsed.scheme,
@@ -373,6 +450,7 @@ class JPLProcessorBaseFactory(THREDDSCatalogBaseFactory):
                 label=label,
                 group=folder,
                 kwargs=self._processor_kwargs(),
+                size=dataset_size,
             ))
 
         return processors_data
@@ -407,6 +485,14 @@ class JPLSMAPL2BProcessorFactory(JPLProcessorBaseFactory):
     https://podaac.jpl.nasa.gov/dataset/SMAP_JPL_L2B_SSS_CAP_V4?ids=Measurement:ProcessingLevel&values=Ocean%20Winds:*2*
     """
 
+    def _processor_kwargs(self):
+        # the coordinates are two dimensional (along track, cross track) and the time only varies along track
+        return {
+            'hdf_latitude': 'lat',
+            'hdf_longitude': 'lon',
+            'hdf_time': 'row_time',
+        }
+
     def _is_using_dataset(self, dataset: str) -> bool:
         return dataset.endswith('.h5')
 
@@ -471,10 +557,11 @@ class NDBCProcessorFactory(THREDDSCatalogBaseFactory):
         for station in catalogs:
             for dataset in station.xpath('//catalog:dataset', namespaces=self.namespaces):
                 if self._is_using_dataset(dataset.get('name')):
-                    dataset_paths.append(dataset.get('urlPath'))
+                    # the file's size is a relative estimate of its subset's size
+                    dataset_paths.append((dataset.get('urlPath'), self._dataset_size(dataset), self._is_realtime_dataset(dataset.get('name'))))
 
         # build a list of processors for all the relevant datasets
-        for dataset_path in dataset_paths:
+        for dataset_path, dataset_size, is_realtime in dataset_paths:
             label, _ = os.path.splitext(os.path.basename(dataset_path))  # remove extension since it's handled later
             url = '{}://{}/{}/{}'.format(
                 self._provider_url_parsed.scheme,
@@ -487,11 +574,17 @@ class NDBCProcessorFactory(THREDDSCatalogBaseFactory):
                 provider_id=self._provider.id,
                 url=url,
                 label=label,
-                kwargs=self._processor_kwargs(),
+                # real-time records are only ever added so refreshes only retrieve the newer records
+                kwargs=dict(self._processor_kwargs(), append_time_series=is_realtime),
+                size=dataset_size,
             ))
 
         return processors_data
 
+    def _is_realtime_dataset(self, dataset: str) -> bool:
+        matched = self.RE_PATTERN.match(dataset)
+        return matched is not None and int(matched.group('year')) == self.REALTIME_YEAR
+
     def _is_using_dataset(self, dataset: str) -> bool:
         """
         Determines if we're using this dataset.
@@ -544,6 +637,8 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
     DATUM = 'MLLW'  # required for water level
     FILE_TYPE = 'xml'
     DATE_FORMAT_STR = '%Y%m%d %H:%M'
+    # format of each record's "t" attribute, i.e <wl t="2013-01-01 10:00" v="0.671" .../>
+    RECORD_DATE_FORMAT_STR = '%Y-%m-%d %H:%M'
 
     # products mapped via (api code name, name)
     # example of stations products: https://tidesandcurrents.noaa.gov/mdapi/v0.6/webapi/stations/1611400/products.json
@@ -562,7 +657,7 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
         processors_data = []
 
         # fetch and parse the station listings
-        stations_response = requests.get(self.API_STATIONS_URL, timeout=10)
+        stations_response = self._get(self.API_STATIONS_URL, timeout=10)
         stations_response.raise_for_status()
         stations_json = stations_response.json()
         stations = stations_json['stations']
@@ -579,7 +674,7 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
                 continue
 
             # get a list of products this station offers
-            products_request = requests.get(station['products']['self'], timeout=10)
+            products_request = self._get(station['products']['self'], timeout=10)
             if products_request.ok:
                 station_products = [p['name'] for p in products_request.json()['products']]
             else:
@@ -609,7 +704,7 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
                 if product[0] == self.PRODUCT_WATER_LEVEL[0]:
 
                     # skip this station if it doesn't offer the right DATUM
-                    datum_request = requests.get(station['datums']['self'], timeout=10)
+                    datum_request = self._get(station['datums']['self'], timeout=10)
                     if datum_request.ok:
                         if not [d for d in datum_request.json()['datums'] if d['name'] == self.DATUM]:
                             continue
@@ -641,6 +736,16 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
 
         return processors_data
 
+    def _processor_kwargs(self):
+        # station observations are only ever added so refreshes shorten the "begin_date" and append the newer records
+        return {
+            'append_time_series': True,
+            'time_series_attribute': 't',
+            'time_series_format': self.RECORD_DATE_FORMAT_STR,
+            'time_series_begin_parameter': 'begin_date',
+            'time_series_begin_format': self.DATE_FORMAT_STR,
+        }
+
 
 @register_factory(storm_models.PROCESSOR_DATA_FACTORY_NWM)
 class NWMProcessorFactory(ProcessorCoreFactory):
@@ -661,27 +766,26 @@ class NWMProcessorFactory(ProcessorCoreFactory):
 
     def _processors_data(self) -> List[ProcessorData]:
         processors_data = []
-        ftp = FTP(self._provider_url_parsed.hostname)
-        ftp.login()
-        base_path = self._provider_url_parsed.path
-        directory_dates = ftp.nlst(base_path)
-        if directory_dates:
-            base_path = directory_dates[-1]  # arbitrarily choosing the most recent date in the interim
-            for directory_product in ftp.nlst(base_path):
-                if os.path.basename(directory_product) in self.PRODUCT_DIRECTORIES:
-                    files = ftp.nlst(directory_product)
-                    for file in files:
-                        # we only want tm02 files ("time minus 2 hour files, valid two hours before cycle time)
-                        if os.path.basename(directory_product) != self.PRODUCT_TIME_SLICE and not os.path.basename(file).startswith('nwm.t02z.'):
-                            continue
-                        processors_data.append(ProcessorData(
-                            named_storm_id=self._named_storm.id,
-                            provider_id=self._provider.id,
-                            url='ftp://{}{}'.format(self._provider_url_parsed.hostname, file),
-                            label=os.path.basename(file),
-                            kwargs=self._processor_kwargs(),
-                            group=os.path.basename(directory_product),
-                        ))
+        with ftp_connection(self._provider_url_parsed.hostname) as ftp:
+            base_path = self._provider_url_parsed.path
+            directory_dates = ftp.nlst(base_path)
+            if directory_dates:
+                base_path = directory_dates[-1]  # arbitrarily choosing the most recent date in the interim
+                for directory_product in ftp.nlst(base_path):
+                    if os.path.basename(directory_product) in self.PRODUCT_DIRECTORIES:
+                        files = ftp.nlst(directory_product)
+                        for file in files:
+                            # we only want tm02 files ("time minus 2 hour files, valid two hours before cycle time)
+                            if os.path.basename(directory_product) != self.PRODUCT_TIME_SLICE and not os.path.basename(file).startswith('nwm.t02z.'):
+                                continue
+                            processors_data.append(ProcessorData(
+                                named_storm_id=self._named_storm.id,
+                                provider_id=self._provider.id,
+                                url='ftp://{}{}'.format(self._provider_url_parsed.hostname, file),
+                                label=os.path.basename(file),
+                                kwargs=self._processor_kwargs(),
+                                group=os.path.basename(directory_product),
+                            ))
 
         # filter
         processors_data = self.generic_filter(processors_data)
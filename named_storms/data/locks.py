@@ -0,0 +1,37 @@
+import time
+import fcntl
+
+
+class FileLock:
+    """
+    Exclusive lock between the worker processes on a single host, held for the duration of a `with` block.
+
+    flock isn't reliably honored across hosts on network volumes (i.e NFS/EFS) so it only guards state where a rare
+    overlap between hosts is harmless (i.e the download cache and the throttles).  State which needs to be exact
+    across hosts is kept in the database under a row lock (`select_for_update`) instead.
+
+    The lock is polled (vs blocking in flock) so the other greenlets of a gevent worker keep running while it's contended,
+    and holders shouldn't do anything which yields for long (i.e publishing tasks or writing to the database).
+    """
+    POLL_INTERVAL = 0.01  # seconds (doubled up to the maximum while contended)
+    MAX_POLL_INTERVAL = 0.5
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self._path, 'a')
+        interval = self.POLL_INTERVAL
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except BlockingIOError:
+                # a (gevent patched) sleep yields to the other greenlets
+                time.sleep(interval)
+                interval = min(self.MAX_POLL_INTERVAL, interval * 2)
+
+    def __exit__(self, *args):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+from django.conf import settings
+
+
+def file_hash(path: str, chunk_size=1024 * 1024) -> str:
+    """
+    :return: sha256 hex digest of a file's contents
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class CoveredDataManifest:
+    """
+    Records every collected file for a covered data snapshot, keyed by the source url.
+
+    Each entry includes:
+        - path: path to the collected file relative to the covered data directory (or None if nothing was stored)
+        - url: source url
+        - size: size in bytes of the collected file
+        - etag: upstream ETag (if available)
+        - last_modified: upstream Last-Modified (if available)
+        - hash: sha256 of the collected file
+        - parameters: the processing parameters (i.e time window and extent of a subset) which shaped the file
+
+    The manifest lives alongside the covered data itself so a re-collection can compare against the previous complete copy.
+    """
+    _path: str = None
+    _entries: dict = None
+
+    def __init__(self, covered_data_path: str):
+        self._path = os.path.join(covered_data_path, settings.CWWED_COVERED_DATA_MANIFEST_FILE_NAME)
+        self._entries = {}
+
+    @classmethod
+    def load(cls, covered_data_path: str):
+        manifest = cls(covered_data_path)
+        if os.path.exists(manifest._path):
+            with open(manifest._path) as f:
+                manifest._entries = json.load(f)
+        return manifest
+
+    def entries(self) -> dict:
+        return self._entries
+
+    def get(self, url: str) -> dict:
+        return self._entries.get(url)
+
+    def add(self, entry: dict):
+        self._entries[entry['url']] = entry
+
+    def save(self):
+        with open(self._path, 'w') as f:
+            json.dump(self._entries, f, indent=2, sort_keys=True)
+
+    def unchanged_entry(self, url: str, etag: str = None, last_modified: str = None, parameters: dict = None) -> dict:
+        """
+        :return: the previous entry for a url if the upstream validators and processing parameters match, otherwise None
+        """
+        entry = self.get(url)
+        # we can't determine if anything has changed without upstream validators
+        if entry is None or not any([etag, last_modified]):
+            return None
+        if entry.get('parameters') != parameters:
+            return None
+        if etag and entry.get('etag') != etag:
+            return None
+        if last_modified and entry.get('last_modified') != last_modified:
+            return None
+        return entry
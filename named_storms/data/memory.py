@@ -0,0 +1,112 @@
+"""
+Worker memory budget.
+
+Every dataset task reserves its processor's estimated peak memory in a ledger shared by the worker's processes (a small
+file on local disk) and refuses to start if the reservation would exceed the worker's budget.
+"""
+import os
+import json
+import uuid
+import time
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from named_storms.data.locks import FileLock
+
+# cgroup (v1 and v2) memory limits
+CGROUP_MEMORY_LIMIT_PATHS = (
+    '/sys/fs/cgroup/memory.max',
+    '/sys/fs/cgroup/memory/memory.limit_in_bytes',
+)
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def worker_memory_budget():
+    """
+    :return: bytes the worker's tasks may reserve (explicitly configured or a fraction of the container's limit) or None if unlimited
+    """
+    if settings.CWWED_WORKER_MEMORY_BUDGET:
+        return settings.CWWED_WORKER_MEMORY_BUDGET
+    for path in CGROUP_MEMORY_LIMIT_PATHS:
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+        except IOError:
+            continue
+        # unlimited containers report "max" (v2) or a huge number (v1)
+        if limit.isdigit() and int(limit) < 2 ** 60:
+            return int(int(limit) * settings.CWWED_WORKER_MEMORY_BUDGET_RATIO)
+    return None
+
+
+@contextmanager
+def memory_reservation(estimate: int, description: str = ''):
+    """
+    Reserves the estimated memory for the duration of the `with` block.
+    Waits a little for other tasks to release their reservations before refusing (`process_dataset_task` then reroutes
+    the task to the high memory workers).
+    """
+    budget = worker_memory_budget()
+    if budget is None or not estimate:
+        yield
+        return
+
+    reservation_id = uuid.uuid4().hex
+    expiration = time.time() + settings.CWWED_WORKER_MEMORY_WAIT
+    while not _reserve(reservation_id, estimate, budget):
+        if time.time() >= expiration:
+            raise MemoryBudgetExceeded('Estimated {} bytes for {} exceeds the worker memory budget of {} bytes'.format(
+                estimate, description, budget))
+        time.sleep(1)
+
+    try:
+        yield
+    finally:
+        with _ledger() as ledger:
+            ledger.pop(reservation_id, None)
+
+
+def _reserve(reservation_id: str, estimate: int, budget: int) -> bool:
+    with _ledger() as ledger:
+        reserved = sum(r['bytes'] for r in ledger.values())
+        # a task larger than the whole budget is only allowed to run alone
+        if reserved and reserved + estimate > budget:
+            return False
+        if estimate > budget:
+            logging.warning('Estimated memory ({} bytes) exceeds the worker memory budget ({} bytes)'.format(estimate, budget))
+        ledger[reservation_id] = {'pid': os.getpid(), 'bytes': estimate}
+        return True
+
+
+@contextmanager
+def _ledger() -> dict:
+    """
+    Yields the reservations (keyed by id) under an exclusive lock, excluding any held by processes which no longer exist
+    """
+    path = settings.CWWED_WORKER_MEMORY_LEDGER
+    with FileLock('{}.lock'.format(path)):
+        try:
+            with open(path) as f:
+                ledger = json.load(f)
+        except (IOError, ValueError):
+            ledger = {}
+
+        ledger = dict((k, r) for k, r in ledger.items() if _is_running(r['pid']))
+
+        yield ledger
+
+        with open(path, 'w') as f:
+            json.dump(ledger, f)
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,56 @@
+import logging
+import xarray
+from django.conf import settings
+
+# encoding keys which (losslessly) restore how the source packed a variable, i.e int16 with a scale factor and offset
+PACKING_ENCODING_KEYS = ('dtype', 'scale_factor', 'add_offset', '_FillValue', 'missing_value')
+
+
+def netcdf_encoding(dataset: xarray.Dataset, source: xarray.Dataset = None, time_dimension: str = None, unlimited_dims=None) -> dict:
+    """
+    Builds the `to_netcdf` encoding for the configured output profile (CWWED_NETCDF_OUTPUT_PROFILE):
+        - zlib/shuffle compression for numeric variables
+        - packing (dtype, scale factor & offset) carried over from the source variable when it was packed to begin with,
+          since re-packing with the same parameters is lossless
+        - chunk shapes capped per dimension so a single time step or a small region can be read without the whole variable
+    :param dataset: dataset being written
+    :param source: original (i.e remote) dataset whose variables carry the source encoding
+    :param time_dimension: name of the time dimension which is chunked separately from the spatial dimensions
+    :param unlimited_dims: dimensions which may be chunked beyond their current size
+    """
+    profile = settings.CWWED_NETCDF_OUTPUT_PROFILE
+    unlimited_dims = set(unlimited_dims or [])
+    encoding = {}
+
+    for name, variable in dataset.variables.items():
+        variable_encoding = {}
+
+        # lossless packing when the source variable was packed
+        source_encoding = source[name].encoding if source is not None and name in source.variables else variable.encoding
+        if profile['pack'] and any(k in source_encoding for k in ('scale_factor', 'add_offset')):
+            variable_encoding.update({k: source_encoding[k] for k in PACKING_ENCODING_KEYS if k in source_encoding})
+
+        # compress and chunk numeric, non-scalar variables
+        if variable.dtype.kind in 'biuf' and variable.ndim and all(variable.shape):
+            if profile['zlib']:
+                variable_encoding.update(zlib=True, complevel=profile['complevel'], shuffle=profile['shuffle'])
+            variable_encoding['chunksizes'] = tuple(
+                _chunk_size(size, profile, dim == time_dimension, dim in unlimited_dims) for dim, size in zip(variable.dims, variable.shape))
+
+        if variable_encoding:
+            encoding[name] = variable_encoding
+
+    return encoding
+
+
+def _chunk_size(size: int, profile: dict, is_time: bool, unlimited: bool) -> int:
+    chunk = profile['chunk_time'] if is_time else profile['chunk_other']
+    # fixed dimensions can't have chunks larger than themselves
+    return chunk if unlimited else min(size, chunk)
+
+
+def log_savings(url: str, uncompressed_size: int, size: int):
+    if not uncompressed_size:
+        return
+    logging.info('Output profile saved {:.1%} ({} of {} bytes) for {}'.format(
+        1 - size / uncompressed_size, uncompressed_size - size, uncompressed_size, url))
@@ -1,17 +1,31 @@
 import os
-import tempfile
-import shutil
-import ssl
+import json
+import math
+import hashlib
 import logging
-from ftplib import FTP
-from urllib.parse import urlparse, ParseResult
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, urlencode, parse_qs, ParseResult
 import h5py
+import netCDF4
 import numpy
 from typing import List, NamedTuple
 import requests
 import xarray.backends
+from lxml import etree
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from named_storms.data.cache import DownloadCache, clone_file
+from named_storms.data.connections import http_session, ftp_connection
+from named_storms.data.coordinates import index_slice, longitude_slices
+from named_storms.data.manifest import CoveredDataManifest, file_hash
+from named_storms.data.output import netcdf_encoding, log_savings
 from named_storms.models import CoveredDataProvider, NamedStorm, NamedStormCoveredData
-from named_storms.utils import named_storm_covered_data_incomplete_path, create_directory
+from named_storms.utils import named_storm_covered_data_incomplete_path, named_storm_covered_data_archive_path, create_directory
 
 
 DEFAULT_DIMENSION_TIME = 'time'
@@ -19,6 +33,10 @@ DEFAULT_DIMENSION_LATITUDE = 'latitude'
 DEFAULT_DIMENSION_LONGITUDE = 'longitude'
 DEFAULT_LABEL = 'data'
 
+# per process semaphores which cap the concurrent connections to each host
+_HOST_SEMAPHORES = {}
+_HOST_SEMAPHORES_LOCK = threading.Lock()
+
 
 # using named tuple as data structure which is passed to the processor task.
 # this was chosen because it's easily serializable via celery while still offering type-hints
@@ -32,12 +50,17 @@ class ProcessorData(NamedTuple):
     dimension_latitude: str = None
     dimension_longitude: str = None
     kwargs: dict = dict()
+    size: int = None  # estimated size in bytes (if known) which is used to schedule the largest datasets first
 
 
 class BaseProcessor:
     """
     Base Processor from which all processors extend
     """
+    # whether the processor spends most of its time processing (vs waiting on the network) which determines its task queue
+    CPU_BOUND = False
+    # whether the output is a subset of the upstream data (cut to the covered data's time window and extent)
+    SUBSET = False
 
     _url: str = None
     _url_parsed: ParseResult = None
@@ -54,6 +77,15 @@ class BaseProcessor:
     _dimension_longitude: str = None
     _dimensions: set = set()
     _kwargs: dict = dict()
+    _upstream_etag: str = None
+    _upstream_last_modified: str = None
+    _upstream_size: int = None
+    _upstream_accepts_ranges: bool = False
+    _output_size: int = None
+    _output_hash: str = None
+    _output_uncompressed_size: int = None
+    _date_collected: str = None
+    _reused: bool = False
 
     def __init__(self, named_storm: NamedStorm, provider: CoveredDataProvider, url: str, label=None, group=None,
                  dimension_time=None, dimension_latitude=None, dimension_longitude=None, **kwargs):
@@ -71,9 +103,6 @@ class BaseProcessor:
         self._named_storm_covered_data = self._named_storm.namedstormcovereddata_set.get(
             covered_data=self._provider.covered_data)
 
-        # conditionally toggle ssl verification
-        self._toggle_verify_ssl(enable=self._verify_ssl())
-
         # create top level staging directory
         create_directory(self._incomplete_path())
 
@@ -83,6 +112,13 @@ class BaseProcessor:
         # store output directory
         create_directory(os.path.dirname(self._output_path))
 
+    @classmethod
+    def estimate_peak_memory(cls, processor_data: ProcessorData) -> int:
+        """
+        Estimates the processor's peak memory (in bytes) before it runs, which determines where (and whether) it's scheduled
+        """
+        return settings.CWWED_PROCESSOR_BASELINE_MEMORY
+
     def to_dict(self):
         return {
             'output_path': self._output_path,
@@ -92,7 +128,39 @@ class BaseProcessor:
             'named_storm': str(self._named_storm),
             'covered_data': str(self._named_storm_covered_data),
             'provider': str(self._provider),
+            'manifest': self.manifest_entry(),
+        }
+
+    def manifest_entry(self) -> dict:
+        return {
+            'path': os.path.relpath(self._output_path, self._incomplete_path()) if self._output_size is not None else None,
+            'url': self._url,
+            'size': self._output_size,
+            'etag': self._upstream_etag,
+            'last_modified': self._upstream_last_modified,
+            'hash': self._output_hash,
+            'uncompressed_size': self._output_uncompressed_size,
+            'date_collected': self._date_collected,
+            'reused': self._reused,
+            'parameters': self._processing_parameters(),
+        }
+
+    def _processing_parameters(self) -> dict:
+        """
+        :return: the parameters which shaped the output (normalized as json) which must match for it to be reused
+        """
+        parameters = {
+            'processor': type(self).__name__,
+            'dimensions': [self._dimension_time, self._dimension_latitude, self._dimension_longitude],
+            'kwargs': self._kwargs,
         }
+        if self.SUBSET:
+            parameters.update({
+                'date_start': self._named_storm_covered_data.date_start.isoformat() if self._named_storm_covered_data.date_start else None,
+                'date_end': self._named_storm_covered_data.date_end.isoformat() if self._named_storm_covered_data.date_end else None,
+                'extent': list(self._named_storm_covered_data.geo.extent),
+            })
+        return json.loads(json.dumps(parameters, sort_keys=True, default=str))
 
     def fetch(self):
         try:
@@ -101,6 +169,16 @@ class BaseProcessor:
             self._success = False
             raise
 
+        # record when the dataset was collected and the file's size and hash (unless it was reused from the previous collection)
+        if not self._reused:
+            self._date_collected = timezone.now().isoformat()
+            if os.path.exists(self._output_path):
+                self._output_size = os.path.getsize(self._output_path)
+                self._output_hash = file_hash(self._output_path)
+                # report what the output profile saved for processors which (re)write their output
+                if self._output_uncompressed_size is not None:
+                    log_savings(self._url, self._output_uncompressed_size, self._output_size)
+
     def _fetch(self):
         raise NotImplementedError
 
@@ -111,6 +189,79 @@ class BaseProcessor:
             self._named_storm_covered_data.covered_data.name,
         )
 
+    def _complete_path(self):
+        # return path for the previous complete copy of this covered data
+        return named_storm_covered_data_archive_path(self._named_storm, self._named_storm_covered_data.covered_data)
+
+    def _reuse_previous_output(self) -> bool:
+        """
+        Hard-links the previously collected file into the staging directory if the upstream validators haven't changed
+        and it was processed with the same parameters (i.e the storm's time window and extent weren't edited)
+        :return: whether the previous output was reused
+        """
+        manifest = CoveredDataManifest.load(self._complete_path())
+        parameters = self._processing_parameters()
+        if self._upstream_etag or self._upstream_last_modified:
+            entry = manifest.unchanged_entry(self._url, self._upstream_etag, self._upstream_last_modified, parameters)
+        else:
+            # without upstream validators, only reuse datasets which were collected after the storm's time window ended
+            entry = manifest.get(self._url)
+            if entry is not None and (entry.get('parameters') != parameters or not self._is_window_complete(entry.get('date_collected'))):
+                entry = None
+        if entry is None:
+            return False
+
+        # nothing was stored for this url in the previous collection (i.e empty dataset)
+        if entry['path'] is None:
+            self._reused = True
+            return True
+
+        previous_path = os.path.join(self._complete_path(), entry['path'])
+        if not os.path.exists(previous_path):
+            return False
+
+        clone_file(previous_path, self._output_path)
+
+        self._output_size = entry['size']
+        self._output_hash = entry['hash']
+        self._output_uncompressed_size = entry.get('uncompressed_size')
+        self._date_collected = entry.get('date_collected')
+        self._reused = True
+
+        logging.info('Reusing unchanged dataset from previous collection: {}'.format(self._url))
+
+        return True
+
+    def _previous_output(self):
+        """
+        Only the end of the time window may have changed since it's extended while a storm is active.
+        :return: tuple of the previous collection's manifest entry and file for this url (if it still exists), otherwise None
+        """
+        entry = CoveredDataManifest.load(self._complete_path()).get(self._url)
+        if entry is None or entry['path'] is None:
+            return None
+        previous_parameters = dict(entry.get('parameters') or {}, date_end=None)
+        if previous_parameters != dict(self._processing_parameters(), date_end=None):
+            return None
+        previous_path = os.path.join(self._complete_path(), entry['path'])
+        if not os.path.exists(previous_path):
+            return None
+        return entry, previous_path
+
+    def _is_append_time_series(self) -> bool:
+        # whether the factory flagged this dataset as an append-only time series (i.e real-time station data)
+        return bool(self._kwargs.get('append_time_series'))
+
+    def _is_window_complete(self, date_collected: str) -> bool:
+        """
+        :param date_collected: iso timestamp of a previous collection
+        :return: whether the covered data's time window had already ended by then
+        """
+        date_end = self._named_storm_covered_data.date_end
+        if not date_collected or not date_end:
+            return False
+        return parse_datetime(date_collected) > date_end
+
     def _get_file_extension(self):
         return self._file_extension
 
@@ -158,22 +309,18 @@ class BaseProcessor:
 
         return cmp_start_stamp, cmp_end_stamp
 
-    @staticmethod
-    def _toggle_verify_ssl(enable=True):
-        """
-        Monkey patch ssl verification
-        """
-        if enable:
-            ssl._create_default_https_context = ssl.create_default_context
-        else:
-            ssl._create_default_https_context = ssl._create_unverified_context
-
     @staticmethod
     def _verify_ssl() -> bool:
         return True
 
+    def _http_session(self) -> requests.Session:
+        # the worker's shared session for this host (which conditionally verifies ssl)
+        return http_session(self._url, verify=self._verify_ssl())
+
 
 class GenericFileProcessor(BaseProcessor):
+    PARTIAL_DIR_NAME = '.partial'
+    CHUNK_SIZE = 1024 * 1024
 
     def _post_process(self):
         pass
@@ -186,104 +333,569 @@ class GenericFileProcessor(BaseProcessor):
         return super()._get_file_extension()
 
     def _fetch(self):
-        if self._is_ftp():
-            self._fetch_ftp()
-        else:
-            self._fetch_http()
+
+        # skip the download if the upstream hasn't changed since the previous collection
+        self._fetch_upstream_validators()
+        if self._reuse_previous_output():
+            return
+
+        # only fetch the records newer than the previous collection for append-only time series
+        if self._is_append_time_series() and self._append_time_series():
+            return
+
+        # link the download from the shared cache when another storm already fetched it, otherwise download and cache it
+        cache = DownloadCache() if DownloadCache.enabled() else None
+        if cache is None or not cache.get(self._url, self._output_path, self._upstream_etag, self._upstream_last_modified):
+            if self._is_ftp():
+                self._fetch_ftp()
+            else:
+                self._fetch_http()
+            if cache is not None:
+                cache.add(self._url, self._output_path, self._upstream_etag, self._upstream_last_modified)
 
         # run any post processing on the dataset
         self._post_process()
 
-    @staticmethod
-    def _get_tmp_file():
-        _, tmp_file = tempfile.mkstemp()
-        return tmp_file
+    def _append_time_series(self) -> bool:
+        """
+        Requests only the records since the previous collection's last record (by shortening the url's begin date parameter)
+        and appends the new records to a copy of the previous (xml) file.
+        The processor kwargs define the time series:
+            - time_series_attribute: attribute holding each record's timestamp (i.e "t")
+            - time_series_format: format of the record timestamps
+            - time_series_begin_parameter: url query parameter for the beginning of the requested window (i.e "begin_date")
+            - time_series_begin_format: format of the begin parameter
+        :return: whether the previous output was extended
+        """
+        previous = self._previous_output()
+        if previous is None:
+            return False
+        _, previous_path = previous
+
+        try:
+            document = etree.parse(previous_path)
+        except etree.XMLSyntaxError:
+            return False
+
+        records = self._time_series_records(document)
+        if not records:
+            return False
+        last_timestamp = self._time_series_timestamp(records[-1])
+
+        # request everything since (and including) the last record and drop what we already have
+        query = parse_qs(self._url_parsed.query)
+        query[self._kwargs['time_series_begin_parameter']] = [last_timestamp.strftime(self._kwargs['time_series_begin_format'])]
+        url = self._url_parsed._replace(query=urlencode(query, doseq=True)).geturl()
+
+        response = self._http_session().get(url, timeout=10)
+        response.raise_for_status()
+        try:
+            new_records = self._time_series_records(etree.fromstring(response.content))
+        except etree.XMLSyntaxError:
+            new_records = []
+        new_records = [record for record in new_records if self._time_series_timestamp(record) > last_timestamp]
+
+        # append the records alongside the existing ones and atomically replace the output
+        records[-1].getparent().extend(new_records)
+        partial_file = self._get_partial_file()
+        document.write(partial_file, xml_declaration=True, encoding=document.docinfo.encoding or 'UTF-8')
+        self._move_partial_file_to_complete(partial_file)
+
+        logging.info('Appended {} records to the previous collection of {}'.format(len(new_records), self._url))
+
+        return True
+
+    def _time_series_records(self, document) -> list:
+        return document.xpath('//*[@{}]'.format(self._kwargs['time_series_attribute']))
+
+    def _time_series_timestamp(self, record) -> datetime:
+        return datetime.strptime(record.get(self._kwargs['time_series_attribute']), self._kwargs['time_series_format'])
 
-    def _move_tmp_file_to_complete(self, tmp_file):
+    def _get_partial_file(self) -> str:
+        """
+        Returns a stable path (keyed by the url) to download into so a retry can resume where it left off.
+        It lives in the storm's staging directory so it's on the same file system as the output path.
+        """
+        partial_dir = create_directory(os.path.join(named_storm_covered_data_incomplete_path(self._named_storm), self.PARTIAL_DIR_NAME))
+        return os.path.join(partial_dir, hashlib.sha1(self._url.encode()).hexdigest())
+
+    @classmethod
+    def purge_stale_partial_files(cls, named_storm):
+        """
+        Removes a storm's partial downloads which haven't been written to in a while (i.e their url was never retried)
+        """
+        partial_dir = os.path.join(named_storm_covered_data_incomplete_path(named_storm), cls.PARTIAL_DIR_NAME)
+        if not os.path.isdir(partial_dir):
+            return
+        stale = time.time() - settings.CWWED_PARTIAL_FILE_MAX_AGE
+        for file_name in os.listdir(partial_dir):
+            path = os.path.join(partial_dir, file_name)
+            try:
+                if os.path.getmtime(path) < stale:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _partial_validators_path(self, partial_file) -> str:
+        return '{}.validators.json'.format(partial_file)
+
+    def _resumable_offset(self, partial_file) -> int:
+        """
+        A partial file is only resumed when it was downloaded from the same upstream version, otherwise old and new bytes
+        would be spliced together, so it's discarded when the upstream validators differ or are unavailable.
+        :return: offset to resume the download from
+        """
+        validators = {'etag': self._upstream_etag, 'last_modified': self._upstream_last_modified}
+        validators_path = self._partial_validators_path(partial_file)
+
+        offset = 0
+        if os.path.exists(partial_file) and any(validators.values()):
+            try:
+                with open(validators_path) as f:
+                    if json.load(f) == validators:
+                        offset = os.path.getsize(partial_file)
+            except (IOError, ValueError):
+                pass
+
+        if not offset:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            # record which upstream version the partial file is downloaded from
+            with open(validators_path, 'w') as f:
+                json.dump(validators, f)
+
+        return offset
+
+    def _move_partial_file_to_complete(self, partial_file):
         # set file permissions -rw-r--r-- (using octal literal notation)
-        os.chmod(tmp_file, 0o644)
+        os.chmod(partial_file, 0o644)
+
+        # atomic move
+        os.replace(partial_file, self._output_path)
 
-        shutil.move(tmp_file, self._output_path)
+        if os.path.exists(self._partial_validators_path(partial_file)):
+            os.remove(self._partial_validators_path(partial_file))
+
+    @staticmethod
+    def _verify_partial_file_size(partial_file, expected_size):
+        # raise an exception (which retries the task and resumes the download) if the file is incomplete
+        if expected_size is not None and os.path.getsize(partial_file) != expected_size:
+            raise IOError('Incomplete download: {} of {} bytes'.format(os.path.getsize(partial_file), expected_size))
 
     def _is_ftp(self):
         return self._url.startswith('ftp://')
 
+    def _fetch_upstream_validators(self):
+        """
+        Captures the upstream ETag/Last-Modified values (when available) so unchanged files can be skipped on re-collection.
+        Failures are ignored since not every upstream supports these requests.
+        """
+        try:
+            if self._is_ftp():
+                with ftp_connection(self._url_parsed.hostname) as ftp:
+                    # i.e "213 20180924123456"
+                    self._upstream_last_modified = ftp.sendcmd('MDTM {}'.format(self._url_parsed.path)).split()[-1]
+            else:
+                response = self._http_session().head(self._url, allow_redirects=True, timeout=10)
+                if response.ok:
+                    self._upstream_etag = response.headers.get('ETag')
+                    self._upstream_last_modified = response.headers.get('Last-Modified')
+                    # only plain (unencoded) content can be split into byte ranges
+                    if response.headers.get('Content-Encoding', 'identity') == 'identity' and response.headers.get('Content-Length', '').isdigit():
+                        self._upstream_size = int(response.headers['Content-Length'])
+                        self._upstream_accepts_ranges = response.headers.get('Accept-Ranges') == 'bytes'
+        except Exception as e:
+            logging.warning('Could not fetch upstream validators for {}: {}'.format(self._url, e))
+
     def _fetch_ftp(self):
-        # connect, login and retrieve file
-        ftp = FTP(self._url_parsed.hostname)
-        ftp.login()
-        tmp_file = self._get_tmp_file()
-        ftp.retrbinary('RETR {}'.format(self._url_parsed.path), open(tmp_file, 'wb').write)
+        partial_file = self._get_partial_file()
+        # resume only when the upstream modification time (MDTM) matches the partial file's
+        offset = self._resumable_offset(partial_file)
+
+        # borrow a logged-in connection and retrieve the file's size (binary mode is required for SIZE)
+        with ftp_connection(self._url_parsed.hostname) as ftp:
+            ftp.voidcmd('TYPE I')
+            size = ftp.size(self._url_parsed.path)
 
-        self._move_tmp_file_to_complete(tmp_file)
+            # start over if the partial file is somehow larger than the source
+            if size is not None and offset > size:
+                offset = 0
+
+            # resume the download from the end of the partial file
+            if size is None or offset < size:
+                with open(partial_file, 'ab' if offset else 'wb') as f:
+                    ftp.retrbinary('RETR {}'.format(self._url_parsed.path), f.write, rest=offset or None)
+
+        self._verify_partial_file_size(partial_file, size)
+        self._move_partial_file_to_complete(partial_file)
 
     def _fetch_http(self):
+        partial_file = self._get_partial_file()
+
+        # download large files in concurrent segments when the server supports byte ranges
+        if self._is_segmented_download():
+            self._fetch_http_segmented(partial_file)
+            return
+
+        offset = self._resumable_offset(partial_file)
+
+        headers = {}
+        if offset:
+            # resume from the end of the partial file but only if the upstream hasn't changed in the meantime
+            headers['Range'] = 'bytes={}-'.format(offset)
+            headers['If-Range'] = self._upstream_etag or self._upstream_last_modified
+
         # fetch the actual file
-        file_req = requests.get(self._url, stream=True, timeout=10)
+        file_req = self._http_session().get(self._url, stream=True, timeout=10, headers=headers)
+
+        # the partial file is already complete
+        if file_req.status_code == 416 and file_req.headers.get('Content-Range') == 'bytes */{}'.format(offset):
+            self._move_partial_file_to_complete(partial_file)
+            return
+
+        # content lengths can only be verified (and ranges resumed) when the content isn't encoded (i.e gzip) in transit
+        is_encoded = file_req.headers.get('Content-Encoding', 'identity') != 'identity'
+
+        # the partial file is unusable so remove it and let the retry start over
+        if file_req.status_code == 416 or (file_req.status_code == 206 and is_encoded):
+            os.remove(partial_file)
+            raise IOError('Unable to resume download of {}'.format(self._url))
+
+        file_req.raise_for_status()
+        is_resumed = file_req.status_code == 206 and not is_encoded
+        if is_encoded:
+            expected_size = None
+        elif is_resumed:
+            # i.e "bytes 1000-9999/10000"
+            total = file_req.headers.get('Content-Range', '').split('/')[-1]
+            expected_size = int(total) if total.isdigit() else None
+        else:
+            content_length = file_req.headers.get('Content-Length')
+            expected_size = int(content_length) if content_length is not None else None
 
-        # write to tmp space then move
-        tmp_file = self._get_tmp_file()
-        with open(tmp_file, 'wb') as f:
-            for chunk in file_req.iter_content(chunk_size=1024):
+        # append to the partial file when resuming, otherwise start over
+        with open(partial_file, 'ab' if is_resumed else 'wb') as f:
+            for chunk in file_req.iter_content(chunk_size=self.CHUNK_SIZE):
                 f.write(chunk)
 
-        self._move_tmp_file_to_complete(tmp_file)
+        self._verify_partial_file_size(partial_file, expected_size)
+        self._move_partial_file_to_complete(partial_file)
 
+    def _is_segmented_download(self) -> bool:
+        return (
+            self._upstream_accepts_ranges and
+            self._upstream_size is not None and
+            self._upstream_size >= settings.CWWED_SEGMENTED_DOWNLOAD_THRESHOLD
+        )
 
-class HierarchicalDataFormatProcessor(GenericFileProcessor):
-    # TODO - this isn't doing any filtering yet
+    def _fetch_http_segmented(self, partial_file):
+        """
+        Splits the file into byte ranges which are fetched concurrently and written in place into a preallocated file.
+        Completed ranges are recorded alongside the file so a retry only fetches the remaining ranges.
+        """
+        size = self._upstream_size
+        segmented_file = '{}.segmented'.format(partial_file)
+        segments_file = '{}.json'.format(segmented_file)
+
+        segment_count = max(1, min(settings.CWWED_SEGMENTED_DOWNLOAD_SEGMENTS, settings.CWWED_SEGMENTED_DOWNLOAD_HOST_CONNECTIONS))
+        segment_size = int(math.ceil(size / segment_count))
+        segments = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+        # resume any completed segments (as long as the upstream and segment layout haven't changed)
+        completed = []
+        if os.path.exists(segmented_file) and os.path.exists(segments_file):
+            with open(segments_file) as f:
+                state = json.load(f)
+            if (any([self._upstream_etag, self._upstream_last_modified]) and state.get('etag') == self._upstream_etag and
+                    state.get('last_modified') == self._upstream_last_modified and state.get('size') == size):
+                # only segments which match the current layout can be reused
+                completed = [tuple(s) for s in state.get('completed', []) if tuple(s) in segments]
+
+        if not completed:
+            # preallocate the file
+            with open(segmented_file, 'wb') as f:
+                f.truncate(size)
+
+        lock = threading.Lock()
+
+        def record_segment(segment):
+            with lock:
+                completed.append(segment)
+                with open(segments_file, 'w') as f:
+                    json.dump({
+                        'etag': self._upstream_etag,
+                        'last_modified': self._upstream_last_modified,
+                        'size': size,
+                        'completed': completed,
+                    }, f)
+
+        errors = []
+        fd = os.open(segmented_file, os.O_WRONLY)
+        try:
+            remaining = [segment for segment in segments if segment not in completed]
+            with ThreadPoolExecutor(max_workers=len(remaining) or 1) as executor:
+                futures = [executor.submit(self._fetch_http_range, fd, segment) for segment in remaining]
+                # keep recording the in-flight segments after a failure so a retry doesn't fetch them again
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        errors.append(future.exception())
+                    else:
+                        record_segment(future.result())
+        finally:
+            os.close(fd)
+
+        # raise the first error (which retries the task and resumes the remaining segments)
+        if errors:
+            raise errors[0]
+
+        # the preallocated file is always full size so verify every byte was actually fetched
+        fetched = sum(end - start + 1 for start, end in set(completed))
+        if set(completed) != set(segments) or fetched != size:
+            raise IOError('Incomplete download: {} of {} bytes'.format(fetched, size))
+
+        os.remove(segments_file)
+        self._move_partial_file_to_complete(segmented_file)
+
+    def _fetch_http_range(self, fd, segment: tuple) -> tuple:
+        """
+        Fetches a single byte range and writes it at its position in the file
+        """
+        start, end = segment
+        headers = {
+            'Range': 'bytes={}-{}'.format(start, end),
+            'Accept-Encoding': 'identity',
+        }
+        # cap the number of concurrent connections to a single host
+        with _host_connection_semaphore(self._url_parsed.hostname):
+            response = self._http_session().get(self._url, stream=True, timeout=10, headers=headers)
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError('Server did not honor the byte range for {}'.format(self._url))
+            position = start
+            for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+        if position != end + 1:
+            raise IOError('Incomplete segment {}-{} for {}'.format(start, end, self._url))
+        return segment
+
+
+def _host_connection_semaphore(host: str) -> threading.BoundedSemaphore:
+    """
+    :return: a (per process) semaphore which caps the number of concurrent segment connections to a host
+    """
+    with _HOST_SEMAPHORES_LOCK:
+        if host not in _HOST_SEMAPHORES:
+            _HOST_SEMAPHORES[host] = threading.BoundedSemaphore(settings.CWWED_SEGMENTED_DOWNLOAD_HOST_CONNECTIONS)
+        return _HOST_SEMAPHORES[host]
 
+
+class HierarchicalDataFormatProcessor(GenericFileProcessor):
     """
     Hierarchical Data Format
     https://en.wikipedia.org/wiki/Hierarchical_Data_Format
+
+    Subsets the file to the storm's region and time window.  The latitude, longitude and (optional) time datasets are
+    supplied via `kwargs` and every data variable sharing their shape is copied as a compressed hyperslab into a new file.
+    The coordinates are read in blocks of rows so whole datasets are never loaded into memory.
     """
+    CPU_BOUND = True
+    SUBSET = True
+    LATITUDE_KWARG_KEY = 'hdf_latitude'
+    LONGITUDE_KWARG_KEY = 'hdf_longitude'
+    TIME_KWARG_KEY = 'hdf_time'
+    BLOCK_ROWS = 1024
+    # dimension scale attributes reference objects in the source file so they can't be copied
+    EXCLUDED_ATTRIBUTES = ('DIMENSION_LIST', 'REFERENCE_LIST', 'CLASS', 'NAME')
+
     _dataset_file: h5py.File = None
+    _coordinate_shape: tuple = None
+    _is_empty: bool = False
+
+    @classmethod
+    def estimate_peak_memory(cls, processor_data: ProcessorData) -> int:
+        # each variable's hyperslab is read (decompressed) into memory so it scales with the (compressed) granule's size
+        estimate = super().estimate_peak_memory(processor_data)
+        if processor_data.size:
+            estimate += int(processor_data.size * settings.CWWED_HDF_MEMORY_FACTOR)
+        return estimate
+
+    def _fetch(self):
+        # download/filter the file
+        super()._fetch()
+        # skip and remove file if it's an empty dataset
+        if not self._reused and self._is_empty:
+            logging.info('Skipping dataset with no values')
+            os.remove(self._output_path)
 
     def _filter_dataset(self):
-        pass
+        lat_key = self._kwargs.get(self.LATITUDE_KWARG_KEY)
+        lon_key = self._kwargs.get(self.LONGITUDE_KWARG_KEY)
+
+        # can't filter without knowing the coordinates
+        if not lat_key or not lon_key:
+            return
+
+        time_key = self._kwargs.get(self.TIME_KWARG_KEY)
+        self._coordinate_shape = self._dataset_file[lat_key].shape
+
+        bounds = self._hyperslab_bounds(
+            self._dataset_file[lat_key], self._dataset_file[lon_key], self._dataset_file[time_key] if time_key else None)
+
+        if bounds is None:
+            self._is_empty = True
+            return
+
+        filtered_path = '{}.filtered'.format(self._output_path)
+        self._output_uncompressed_size = 0
+        with h5py.File(filtered_path, 'w') as filtered_file:
+            self._copy_attributes(self._dataset_file, filtered_file)
+            self._dataset_file.visititems(lambda name, obj: self._copy_hyperslab(name, obj, filtered_file, bounds))
+
+        self._dataset_file.close()
+
+        # replace the file with the filtered data
+        os.replace(filtered_path, self._output_path)
+
+    def _hyperslab_bounds(self, lat: h5py.Dataset, lon: h5py.Dataset, time: h5py.Dataset = None):
+        """
+        Finds the index bounds (along every dimension of the coordinates) which contain the storm's region and time window
+        :return: tuple of slices or None if nothing is in range
+        """
+        storm_extent = self._covered_data_extent()
+        time_start, time_end = self._provider_start_end_timestamps()
+
+        index_min = None
+        index_max = None
+
+        for row_start in range(0, lat.shape[0], self.BLOCK_ROWS):
+            rows = slice(row_start, row_start + self.BLOCK_ROWS)
+            block_lat = lat[rows]
+            block_lon = numpy.mod(lon[rows], 360)  # the extent is in "degrees_east" (0-360)
+
+            mask = (
+                (block_lat >= storm_extent[1]) & (block_lat <= storm_extent[3]) &
+                (block_lon >= storm_extent[0]) & (block_lon <= storm_extent[2])
+            )
+
+            # time is either the same shape as the coordinates or only varies along the first dimension (i.e "row_time")
+            if time is not None:
+                block_time = time[rows]
+                in_window = (block_time >= time_start) & (block_time <= time_end)
+                if in_window.ndim < mask.ndim:
+                    in_window = in_window.reshape(in_window.shape + (1,) * (mask.ndim - in_window.ndim))
+                mask = mask & in_window
+
+            indexes = numpy.argwhere(mask)
+            if not len(indexes):
+                continue
+
+            indexes[:, 0] += row_start
+            block_min = indexes.min(axis=0)
+            block_max = indexes.max(axis=0)
+            index_min = block_min if index_min is None else numpy.minimum(index_min, block_min)
+            index_max = block_max if index_max is None else numpy.maximum(index_max, block_max)
+
+        if index_min is None:
+            return None
+
+        return tuple(slice(int(start), int(end) + 1) for start, end in zip(index_min, index_max))
+
+    def _copy_hyperslab(self, name: str, obj, filtered_file: h5py.File, bounds: tuple):
+        if isinstance(obj, h5py.Group):
+            self._copy_attributes(obj, filtered_file.require_group(name))
+            return
+
+        # data variables sharing the coordinates' (leading) dimensions are subset, everything else is copied as-is
+        coordinate_shape = self._coordinate_shape
+        if obj.ndim >= len(coordinate_shape) and obj.shape[:len(coordinate_shape)] == coordinate_shape:
+            selection = bounds
+        elif obj.ndim and obj.shape[0] == coordinate_shape[0]:
+            selection = bounds[:1]
+        else:
+            selection = None
+
+        data = obj[selection] if selection is not None else obj[()]
+        self._output_uncompressed_size += getattr(data, 'nbytes', 0)
+
+        # compress numeric data using the output profile
+        create_kwargs = {}
+        profile = settings.CWWED_NETCDF_OUTPUT_PROFILE
+        if obj.dtype.kind in 'biuf' and obj.ndim and all(data.shape):
+            create_kwargs.update(chunks=True)
+            if profile['zlib']:
+                create_kwargs.update(compression='gzip', compression_opts=profile['complevel'], shuffle=profile['shuffle'])
+
+        dataset = filtered_file.create_dataset(name, data=data, **create_kwargs)
+        self._copy_attributes(obj, dataset)
+
+    def _copy_attributes(self, source, destination):
+        for key, value in source.attrs.items():
+            if key in self.EXCLUDED_ATTRIBUTES:
+                continue
+            try:
+                destination.attrs[key] = value
+            except (TypeError, ValueError) as e:
+                logging.warning('Skipping attribute {} for {}: {}'.format(key, self._url, e))
 
     def _post_process(self) -> None:
-        # open dataset for reading & writing
-        self._dataset_file = h5py.File(self._output_path, 'r+')
+        # open dataset for reading
+        self._dataset_file = h5py.File(self._output_path, 'r')
         # filter
         self._filter_dataset()
         # close
-        self._dataset_file.close()
+        if self._dataset_file.id.valid:
+            self._dataset_file.close()
 
 
 class BinaryFileProcessor(GenericFileProcessor):
     """
-    Parses binary file via numpy.  Expects the `dtype` to be passed in via `kwargs`
+    Parses binary file via numpy.  Expects the `dtype` to be passed in via `kwargs`.
+    The file is filtered by streaming over it (memory mapped) in fixed size blocks of records.
     """
+    CPU_BOUND = True
+    SUBSET = True
     DATA_TYPE_TIME_KEY = 'time'
     DATA_TYPE_LAT_KEY = 'lat'
     DATA_TYPE_LON_KEY = 'lon'
     DATA_TYPE_KWARG_KEY = 'data_type'
+    BLOCK_BYTES = 64 * 1024 * 1024
+
+    _record_count: int = None
 
-    _ndarray: numpy.ndarray = None
+    @classmethod
+    def estimate_peak_memory(cls, processor_data: ProcessorData) -> int:
+        # a block of records, its boolean comparisons/mask and the kept copy, regardless of the file's size
+        data_type = cls._data_type_from_kwargs(processor_data.kwargs)
+        block_records = max(1, cls.BLOCK_BYTES // data_type.itemsize)
+        block_bytes = block_records * data_type.itemsize
+        return super().estimate_peak_memory(processor_data) + 2 * block_bytes + 7 * block_records
 
     def _fetch(self):
         # download/filter the file
         super()._fetch()
+        # previous collection was reused so there's nothing to filter
+        if self._reused:
+            return
         # skip and remove file if it's an empty dataset
-        if len(self._ndarray) == 0:
+        if self._record_count == 0:
             logging.info('Skipping dataset with no values')
             os.remove(self._output_path)
 
-    def _post_process(self) -> None:
+    def _data_type(self) -> numpy.dtype:
+        return self._data_type_from_kwargs(self._kwargs)
+
+    @classmethod
+    def _data_type_from_kwargs(cls, kwargs: dict) -> numpy.dtype:
         # the numpy dtype needs to be a list of tuples so convert it first because celery sends it as a list of lists
-        data_type = [(t[0], t[1]) for t in self._kwargs[self.DATA_TYPE_KWARG_KEY]]
-        data_type = numpy.dtype(data_type)
+        return numpy.dtype([(t[0], t[1]) for t in kwargs[cls.DATA_TYPE_KWARG_KEY]])
 
-        # create the numpy data array from the file using the supplied dtype
-        self._ndarray = numpy.fromfile(self._output_path, dtype=data_type)
+    def _post_process(self) -> None:
+        data_type = self._data_type()
 
         # define the start/end timestamps to compare against
         cmp_start_stamp, cmp_end_stamp = self._provider_start_end_timestamps()
 
-        self._ndarray = self._ndarray[self._ndarray[self.DATA_TYPE_TIME_KEY] >= cmp_start_stamp]
-        self._ndarray = self._ndarray[self._ndarray[self.DATA_TYPE_TIME_KEY] <= cmp_end_stamp]
-
         # filter the data down using lat/lon from the storm's extent
         storm_extent = self._covered_data_extent()
 
@@ -292,18 +904,51 @@ class BinaryFileProcessor(GenericFileProcessor):
         lon_start = storm_extent[0]
         lon_end = storm_extent[2]
 
-        self._ndarray = self._ndarray[self._ndarray[self.DATA_TYPE_LAT_KEY] >= lat_start]
-        self._ndarray = self._ndarray[self._ndarray[self.DATA_TYPE_LAT_KEY] <= lat_end]
-        self._ndarray = self._ndarray[self._ndarray[self.DATA_TYPE_LON_KEY] >= lon_start]
-        self._ndarray = self._ndarray[self._ndarray[self.DATA_TYPE_LON_KEY] <= lon_end]
+        # ignore any trailing partial record (consistent with numpy.fromfile)
+        record_count = os.path.getsize(self._output_path) // data_type.itemsize
+        block_records = max(1, self.BLOCK_BYTES // data_type.itemsize)
 
-        # save the file with the filtered data
-        self._ndarray.tofile(self._output_path)
+        self._record_count = 0
+        filtered_path = '{}.filtered'.format(self._output_path)
+
+        with open(filtered_path, 'wb') as filtered_file:
+
+            # memory map the file (mapping an empty file isn't allowed)
+            if record_count:
+                records = numpy.memmap(self._output_path, dtype=data_type, mode='r', shape=(record_count,))
+
+                for block_start in range(0, record_count, block_records):
+                    block = records[block_start:block_start + block_records]
+
+                    # combined time and bbox predicate
+                    mask = (
+                        (block[self.DATA_TYPE_TIME_KEY] >= cmp_start_stamp) &
+                        (block[self.DATA_TYPE_TIME_KEY] <= cmp_end_stamp) &
+                        (block[self.DATA_TYPE_LAT_KEY] >= lat_start) &
+                        (block[self.DATA_TYPE_LAT_KEY] <= lat_end) &
+                        (block[self.DATA_TYPE_LON_KEY] >= lon_start) &
+                        (block[self.DATA_TYPE_LON_KEY] <= lon_end)
+                    )
+
+                    # append the kept records to the filtered output
+                    kept = block[mask]
+                    kept.tofile(filtered_file)
+                    self._record_count += len(kept)
+
+                # release the memory map before replacing the file
+                del records
+
+        # replace the file with the filtered data
+        os.replace(filtered_path, self._output_path)
 
 
 class OpenDapProcessor(BaseProcessor):
+    # decoding, concatenating and compressing the subsets (in C extensions) would block a green thread pool
+    CPU_BOUND = True
+    SUBSET = True
 
     _dataset: xarray.Dataset = None
+    _subsets: List[xarray.Dataset] = None
     _file_extension: str = 'nc'  # netcdf
     _variables: List[str] = None
     _time_start: float = None
@@ -313,33 +958,161 @@ class OpenDapProcessor(BaseProcessor):
     _lng_start: float = None
     _lng_end: float = None
 
+    @classmethod
+    def estimate_peak_memory(cls, processor_data: ProcessorData) -> int:
+        # the chunks in flight plus the one being written, each of which may be copied when the longitude ranges are concatenated
+        chunks = settings.CWWED_OPENDAP_CHUNKS_IN_FLIGHT + 1
+        return super().estimate_peak_memory(processor_data) + 2 * chunks * settings.CWWED_OPENDAP_CHUNK_BYTES
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # open the dataset url and create the dataset/processor while conditionally disabling ssl verification
-        session = self._session()
-        session.verify = self._verify_ssl()
-        store = xarray.backends.PydapDataStore.open(self._url, session=session)
+        # open the dataset url using the worker's shared session (which conditionally disables ssl verification)
+        store = xarray.backends.PydapDataStore.open(self._url, session=self._http_session())
 
-        # fetch and subset the dataset
+        # fetch and (lazily) subset the dataset
         self._dataset = xarray.open_dataset(store, decode_times=False)
-        self._dataset = self._slice_dataset()
+        self._subsets = self._slice_dataset()
 
     def _fetch(self):
 
+        # skip the subset if it was collected after the storm's time window ended
+        if self._reuse_previous_output():
+            return
+
         # verify it has values after getting the subset
         if not self._dataset_has_dimension_values():
             logging.info('Skipping dataset with no values for a dimension ({}): %s' % self._url)
             return
 
         # store as netcdf and close dataset
-        self._dataset.to_netcdf(self._output_path)
+        self._write_netcdf()
         self._dataset.close()
 
-    def _slice_dataset(self) -> xarray.Dataset:
+    def _write_netcdf(self):
+        """
+        Retrieves the subset in time chunks (sized by the variables' dtypes and shapes) and appends each chunk to the output
+        as it arrives, so memory doesn't depend on the length of the time window.
+        Optionally retrieves several chunks concurrently while still writing them in order.
+        """
+
+        self._output_uncompressed_size = 0
+
+        # no time dimension to chunk by
+        if self._dimension_time not in self._subsets[0].dims:
+            dataset = self._combine_subsets(self._subsets)
+            self._output_uncompressed_size = dataset.nbytes
+            dataset.to_netcdf(self._output_path, format='NETCDF4', encoding=netcdf_encoding(dataset, self._dataset))
+            return
+
+        # append-only time series continue the previous collection's file (from the subset's first newer time step)
+        subset_start, file_offset = 0, 0
+        if self._is_append_time_series():
+            subset_start, file_offset = self._prepare_append() or (0, 0)
+
+        steps = self._subsets[0].dims[self._dimension_time]
+        chunk_steps = self._time_chunk_steps()
+        chunk_slices = [slice(start, min(start + chunk_steps, steps)) for start in range(subset_start, steps, chunk_steps)]
+
+        in_flight = max(1, settings.CWWED_OPENDAP_CHUNKS_IN_FLIGHT)
+        with ThreadPoolExecutor(max_workers=in_flight) as executor:
+            futures = deque()
+            for chunk_slice in chunk_slices:
+                offset = file_offset + chunk_slice.start - subset_start
+                futures.append((offset, executor.submit(self._load_chunk, chunk_slice)))
+                # write the oldest chunk once the maximum number of requests are in flight
+                if len(futures) >= in_flight:
+                    self._write_chunk(*self._pop_chunk(futures))
+            while futures:
+                self._write_chunk(*self._pop_chunk(futures))
+
+    @staticmethod
+    def _pop_chunk(futures: deque) -> tuple:
+        offset, future = futures.popleft()
+        return future.result(), offset
+
+    def _prepare_append(self):
+        """
+        Copies the previous collection's file to the output so only the newer time steps need to be retrieved and appended.
+        The time steps are matched by value (rather than index) since a real-time dataset's window rolls forward.
+        :return: tuple of the subset's first newer time step and the output's next time step, or None to retrieve everything
+        """
+        previous = self._previous_output()
+        if previous is None:
+            return None
+        entry, previous_path = previous
+
+        with netCDF4.Dataset(previous_path) as nc:
+            time_dimension = nc.dimensions.get(self._dimension_time)
+            # files which weren't written with an unlimited time dimension can't be appended to
+            if time_dimension is None or not time_dimension.isunlimited() or not len(time_dimension):
+                return None
+            stored_steps = len(time_dimension)
+            last_time = nc.variables[self._dimension_time][-1]
+
+        subset_start = int(numpy.searchsorted(self._subsets[0][self._dimension_time].values, last_time, side='right'))
+
+        # the copy is modified so it mustn't be a hard-link of the previous collection's file
+        clone_file(previous_path, self._output_path, link=False)
+        self._output_uncompressed_size = entry.get('uncompressed_size') or 0
+
+        logging.info('Appending {} time steps to the previous collection of {}'.format(
+            self._subsets[0].dims[self._dimension_time] - subset_start, self._url))
+
+        return subset_start, stored_steps
+
+    def _time_chunk_steps(self) -> int:
+        """
+        :return: number of time steps per chunk which fit within the configured chunk size
+        """
+        bytes_per_step = 0
+        for subset in self._subsets:
+            for variable in subset.variables.values():
+                if self._dimension_time in variable.dims:
+                    values_per_step = numpy.prod([size for dim, size in zip(variable.dims, variable.shape) if dim != self._dimension_time])
+                    bytes_per_step += int(values_per_step) * variable.dtype.itemsize
+        return max(1, settings.CWWED_OPENDAP_CHUNK_BYTES // max(1, bytes_per_step))
+
+    def _load_chunk(self, chunk_slice: slice) -> xarray.Dataset:
+        # retrieve a single time chunk (for every longitude range) from the server
+        return self._combine_subsets([subset.isel(**{self._dimension_time: chunk_slice}) for subset in self._subsets]).load()
+
+    def _write_chunk(self, chunk: xarray.Dataset, offset: int):
+        # the first chunk creates the file (with an unlimited time dimension) and includes any variables without a time dimension
+        if offset == 0:
+            self._output_uncompressed_size += chunk.nbytes
+            unlimited_dims = [self._dimension_time]
+            encoding = netcdf_encoding(chunk, self._dataset, time_dimension=self._dimension_time, unlimited_dims=unlimited_dims)
+            chunk.to_netcdf(self._output_path, format='NETCDF4', encoding=encoding, unlimited_dims=unlimited_dims)
+            return
+
+        # append the time varying variables along the time dimension
+        with netCDF4.Dataset(self._output_path, 'a') as nc:
+            for name, variable in chunk.variables.items():
+                if self._dimension_time not in variable.dims:
+                    continue
+                index = [slice(None)] * variable.ndim
+                index[variable.dims.index(self._dimension_time)] = slice(offset, offset + chunk.dims[self._dimension_time])
+                values = variable.values
+                self._output_uncompressed_size += values.nbytes
+                # missing values are re-encoded using the variable's fill value (and packed using its scale factor/offset)
+                if values.dtype.kind == 'f':
+                    values = numpy.ma.masked_invalid(values)
+                nc.variables[name][tuple(index)] = values
+
+    def _combine_subsets(self, subsets: List[xarray.Dataset]) -> xarray.Dataset:
+        if len(subsets) == 1:
+            return subsets[0]
+        return xarray.concat(subsets, dim=self._dimension_longitude)
+
+    def _slice_dataset(self) -> List[xarray.Dataset]:
+        """
+        Lazily subsets the dataset
+        :return: list of subsets (i.e two when the storm crosses the longitude seam)
+        """
         # doesn't have expected dimensions
         if not self._dataset_has_expected_dimensions():
-            return self._dataset
+            return [self._dataset]
 
         variables = self._all_variables()
         self._verify_dimensions(variables)
@@ -366,22 +1139,26 @@ class OpenDapProcessor(BaseProcessor):
         #
 
         # find the array indexes for our slices so we can take advantage of opendap's server side processing vs loading everything into memory
-        time_start_idx, time_end_idx = self._constraint_indexes(self._dimension_time, self._time_start, self._time_end)
-        lat_start_idx, lat_end_idx = self._constraint_indexes(self._dimension_latitude, self._lat_start, self._lat_end)
-        lng_start_idx, lng_end_idx = self._constraint_indexes(self._dimension_longitude, self._lng_start, self._lng_end)
-
-        # build filter args
-        filter_kwargs = {
-            self._dimension_time: slice(time_start_idx, time_end_idx),
-            self._dimension_latitude: slice(lat_start_idx, lat_end_idx),
-            self._dimension_longitude: slice(lng_start_idx, lng_end_idx),
-        }
-
-        return self._dataset.isel(**filter_kwargs)
+        time_slice = index_slice(self._dataset[self._dimension_time].values, self._time_start, self._time_end)
+        lat_slice = index_slice(self._dataset[self._dimension_latitude].values, self._lat_start, self._lat_end)
+        lng_slices = longitude_slices(self._dataset[self._dimension_longitude].values, self._lng_start, self._lng_end)
+
+        # nothing in range
+        if not lng_slices:
+            lng_slices = [slice(0, 0)]
+
+        # build a subset for each longitude range (i.e two when the storm crosses the longitude seam)
+        return [
+            self._dataset.isel(**{
+                self._dimension_time: time_slice,
+                self._dimension_latitude: lat_slice,
+                self._dimension_longitude: lng_slice,
+            }) for lng_slice in lng_slices
+        ]
 
     def _dataset_has_dimension_values(self) -> bool:
         # verifies every dimension (i.e "time", "longitude", "latitude") has actual values associated with it
-        return all(map(lambda x: len(self._dataset[x]), list(self._dataset.dims)))
+        return all(size for subset in self._subsets for size in subset.dims.values())
 
     def _dataset_has_expected_dimensions(self) -> bool:
         # returns whether the supplied dimensions exist in the dataset's dimensions
@@ -391,21 +1168,6 @@ class OpenDapProcessor(BaseProcessor):
         # returns whether the supplied dimensions exist in the dataset's variables
         return self._dimensions.issuperset(list(self._dataset.variables.keys()))
 
-    def _constraint_indexes(self, dimension: str, start: float, end: float) -> tuple:
-        """
-        return the index range for our constraint values
-        """
-
-        # convert numpy array to list for comparison
-        values = self._dataset[dimension].values.tolist()
-
-        # TODO - this poorly assumes the data variable is sorted
-        # find the index range and fallback the start/end index to 0/None, respectively, if it's not in range
-        idx_start = next((idx for idx, v in enumerate(values) if v >= start), 0)
-        idx_end = next((idx for idx, v in enumerate(values) if v >= end), None)
-
-        return idx_start, idx_end
-
     def _verify_dimensions(self, variables):
         if not self._dimensions.issubset(variables):
             raise Exception('missing expected dimensions')
@@ -413,11 +1175,6 @@ class OpenDapProcessor(BaseProcessor):
     def _all_variables(self):
         raise NotImplementedError
 
-    def _session(self) -> requests.Session:
-        session = requests.Session()
-        session.verify = self._verify_ssl()
-        return session
-
 
 class GridOpenDapProcessor(OpenDapProcessor):
 
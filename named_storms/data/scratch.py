@@ -0,0 +1,87 @@
+"""
+Shared scratch store (on the data volume) for bulky task results.
+
+Tasks write large payloads here and return a small reference through the result backend instead, which consumers
+resolve lazily (and remove once they're done with them) so broker memory doesn't grow with the size of a crawl.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+from django.conf import settings
+from named_storms.utils import create_directory
+
+REFERENCE_KEY = 'scratch'
+
+
+def _path(name: str) -> str:
+    return os.path.join(settings.CWWED_SCRATCH_DIR, name)
+
+
+def new_path(extension: str = 'dat') -> str:
+    """
+    :return: unique path in the scratch store to write a result to
+    """
+    return _path('{}.{}'.format(uuid.uuid4().hex, extension))
+
+
+def reference(path: str) -> dict:
+    return {REFERENCE_KEY: os.path.basename(path)}
+
+
+def is_reference(value) -> bool:
+    return isinstance(value, dict) and set(value.keys()) == {REFERENCE_KEY}
+
+
+def reference_path(ref: dict) -> str:
+    return _path(ref[REFERENCE_KEY])
+
+
+def remove(ref: dict):
+    if os.path.exists(reference_path(ref)):
+        os.remove(reference_path(ref))
+
+
+def put_json(value):
+    """
+    Returns the value as-is when it's small enough to pass through the result backend, otherwise stores it
+    :return: the value or a reference to it
+    """
+    content = json.dumps(value)
+    if len(content) <= settings.CWWED_TASK_RESULT_INLINE_BYTES:
+        return value
+    path = new_path('json')
+    create_directory(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+    return reference(path)
+
+
+def get_json(value, remove_reference=True):
+    """
+    Resolves a value returned by `put_json`
+    """
+    if not is_reference(value):
+        return value
+    with open(reference_path(value)) as f:
+        result = json.load(f)
+    if remove_reference:
+        remove(value)
+    return result
+
+
+def purge_stale():
+    """
+    Removes any results which were never resolved (i.e the consumer failed)
+    """
+    if not os.path.exists(settings.CWWED_SCRATCH_DIR):
+        return
+    expiration = time.time() - settings.CWWED_SCRATCH_MAX_AGE
+    for name in os.listdir(settings.CWWED_SCRATCH_DIR):
+        path = _path(name)
+        try:
+            if os.path.getmtime(path) < expiration:
+                os.remove(path)
+        except OSError as e:
+            logging.warning('Could not purge scratch result {}: {}'.format(path, e))
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import socket
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from django.conf import settings
+from named_storms.data.locks import FileLock
+from named_storms.utils import create_directory
+
+# responses which indicate the host wants us to slow down
+THROTTLED_STATUS_CODES = (429, 503)
+
+_throttles_lock = threading.Lock()
+_pid = None
+_throttles = {}
+
+
+class HostThrottle:
+    """
+    Adaptive token bucket per upstream host which is shared by every worker.
+
+    Each process paces its own requests with an in-memory bucket (so requests don't touch the data volume) and only
+    syncs with the host's shared state (a small file on the data volume updated under a best effort lock) every
+    `CWWED_THROTTLE_SYNC_INTERVAL` seconds or immediately when the host throttles us.
+    The host's rate is split between the processes which synced recently and adjusted via AIMD (additive increase, multiplicative decrease):
+        - every successful response raises the rate a little (up to the maximum)
+        - throttled responses (429/503) cut the rate (down to the minimum) and honor any Retry-After by pausing the host
+    """
+    _host: str = None
+    _path: str = None
+
+    def __init__(self, host: str):
+        self._host = host
+        # hosts could include a port so keep the file name safe
+        self._path = os.path.join(settings.CWWED_THROTTLE_DIR, re.sub(r'[^\w.-]', '_', host))
+        self._process = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self._lock = threading.Lock()
+        self._rate = settings.CWWED_THROTTLE_INITIAL_RATE  # host-wide rate
+        self._synced_rate = self._rate  # host-wide rate as of the last sync
+        self._processes = 1  # processes sharing the host-wide rate
+        self._tokens = settings.CWWED_THROTTLE_BURST
+        self._updated = time.time()
+        self._paused_until = 0
+        self._synced = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.CWWED_THROTTLE_ENABLED
+
+    def acquire(self):
+        """
+        Blocks until a token is available for the host
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                if now - self._synced >= settings.CWWED_THROTTLE_SYNC_INTERVAL:
+                    self._sync(now)
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self._process_rate()
+            time.sleep(wait)
+
+    def succeeded(self):
+        # only recorded in memory until the next sync
+        with self._lock:
+            self._rate = min(settings.CWWED_THROTTLE_MAX_RATE, self._rate + settings.CWWED_THROTTLE_RATE_INCREASE)
+
+    def throttled(self, retry_after: float = None):
+        with self._lock:
+            now = time.time()
+            # drain the bucket so the new rate takes effect immediately
+            self._tokens = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # share the slow down with every other process right away
+            self._sync(now, throttled=True)
+            logging.warning('Throttling {} to {:.2f} requests per second (retry after {})'.format(self._host, self._rate, retry_after))
+
+    def _process_rate(self) -> float:
+        return self._rate / self._processes
+
+    def _refill(self, now: float):
+        elapsed = max(0, now - self._updated)
+        burst = max(1, settings.CWWED_THROTTLE_BURST / self._processes)
+        self._tokens = min(burst, self._tokens + elapsed * self._process_rate())
+        self._updated = now
+
+    def _sync(self, now: float, throttled=False):
+        """
+        Merges this process' view of the host with the shared state (the caller must hold the lock)
+        """
+        create_directory(os.path.dirname(self._path))
+        with FileLock('{}.lock'.format(self._path)):
+            try:
+                with open(self._path) as f:
+                    state = json.load(f)
+            except (IOError, ValueError):
+                state = {'rate': self._rate, 'paused_until': 0, 'processes': {}}
+
+            if throttled:
+                state['rate'] = max(settings.CWWED_THROTTLE_MIN_RATE, state['rate'] * settings.CWWED_THROTTLE_RATE_DECREASE)
+            else:
+                # apply this process' increases since the last sync
+                state['rate'] = max(settings.CWWED_THROTTLE_MIN_RATE, min(
+                    settings.CWWED_THROTTLE_MAX_RATE, state['rate'] + self._rate - self._synced_rate))
+            state['paused_until'] = max(state['paused_until'], self._paused_until)
+
+            # only the processes which synced recently share the rate
+            state['processes'][self._process] = now
+            state['processes'] = dict(
+                (process, synced) for process, synced in state['processes'].items()
+                if now - synced < settings.CWWED_THROTTLE_SYNC_INTERVAL * 3)
+
+            with open(self._path, 'w') as f:
+                json.dump(state, f)
+
+        self._rate = self._synced_rate = state['rate']
+        self._paused_until = state['paused_until']
+        self._processes = len(state['processes'])
+        self._synced = now
+
+
+def host_throttle(host: str) -> HostThrottle:
+    """
+    :return: the process' throttle for the host
+    """
+    global _pid, _throttles
+    with _throttles_lock:
+        # forked (i.e celery prefork) processes start with their own throttles
+        if _pid != os.getpid():
+            _pid = os.getpid()
+            _throttles = {}
+        if host not in _throttles:
+            _throttles[host] = HostThrottle(host)
+        return _throttles[host]
+
+
+def retry_after_seconds(value: str) -> float:
+    """
+    :param value: Retry-After header which is either a number of seconds or an http date
+    :return: seconds to wait or None if it can't be parsed
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,20 +1,56 @@
 import os
 import shlex
 import subprocess
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import autoreload
 
 
-def restart_celery():
-    # kill celery/flower
+def worker_commands(single=False) -> list:
+    """
+    Returns the worker commands for the queue topology (see CELERY_TASK_ROUTES):
+        - io (and default/email) queues served by a high concurrency gevent pool
+        - cpu queue served by a prefork pool (sized to the cores by default)
+        - archive queue served by a small prefork pool
+        - highmem queue served by a small prefork pool (on a worker with plenty of memory)
+    :param single: whether to run a single worker consuming every queue (i.e for development)
+    """
+    queues = {
+        'io': [settings.CWWED_QUEUE_IO, settings.CWWED_QUEUE_EMAIL, settings.CWWED_QUEUE_DEFAULT],
+        'cpu': [settings.CWWED_QUEUE_CPU],
+        'archive': [settings.CWWED_QUEUE_ARCHIVE],
+        'highmem': [settings.CWWED_QUEUE_HIGH_MEMORY],
+    }
+
+    if single:
+        return ['celery worker -A cwwed -l info -Q {}'.format(','.join(q for qs in queues.values() for q in qs))]
+
+    return [
+        'celery worker -A cwwed -l info -n io@%h -Q {} -P gevent --concurrency={}'.format(
+            ','.join(queues['io']), settings.CWWED_CELERY_IO_CONCURRENCY),
+        'celery worker -A cwwed -l info -n cpu@%h -Q {} -P prefork'.format(
+            ','.join(queues['cpu'])),
+        'celery worker -A cwwed -l info -n archive@%h -Q {} -P prefork --concurrency={}'.format(
+            ','.join(queues['archive']), settings.CWWED_CELERY_ARCHIVE_CONCURRENCY),
+        'celery worker -A cwwed -l info -n highmem@%h -Q {} -P prefork --concurrency={}'.format(
+            ','.join(queues['highmem']), settings.CWWED_CELERY_HIGH_MEMORY_CONCURRENCY),
+    ]
+
+
+def restart_celery(single=False):
+    # kill celery/beat/flower
     cmd = 'pkill celery'
     subprocess.call(shlex.split(cmd))
 
     # include the current environment
     env = os.environ.copy()
 
-    # start celery
-    cmd = 'celery worker -A cwwed -l info'
+    # start celery workers
+    for cmd in worker_commands(single):
+        subprocess.Popen(shlex.split(cmd), env=env)
+
+    # start beat (periodic tasks)
+    cmd = 'celery beat -A cwwed -l info'
     subprocess.Popen(shlex.split(cmd), env=env)
 
     # start flower
@@ -24,5 +60,8 @@ def restart_celery():
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument('--single', action='store_true', help='Run a single worker consuming every queue')
+
     def handle(self, *args, **options):
-        autoreload.main(restart_celery)
+        autoreload.main(restart_celery, kwargs={'single': options['single']})
@@ -1,14 +1,15 @@
-import logging
-import os
-import shutil
+import time
 import celery
-from datetime import datetime
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from named_storms.data.factory import ProcessorCoreFactory
-from named_storms.models import NamedStorm, NamedStormCoveredDataLog, NamedStormCoveredData
-from named_storms.tasks import process_dataset_task, archive_named_storm_covered_data_task
-from named_storms.utils import named_storm_covered_data_incomplete_path, named_storm_covered_data_path, create_directory, processor_factory_class, slack_channel
+from django.db.models import Count
+from django.utils import timezone
+from named_storms.models import (
+    NamedStorm, NamedStormCoveredData, NamedStormCoveredDataCollection, NamedStormCoveredDataCollectionItem, NamedStormCoveredDataLog,
+    COLLECTION_STATUS_RUNNING,
+)
+from named_storms.tasks import covered_data_collection_chain
+from named_storms.utils import named_storm_covered_data_incomplete_path, named_storm_covered_data_path, create_directory, slack_channel
 
 
 class Command(BaseCommand):
@@ -17,6 +18,11 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--storm_id', type=int)
         parser.add_argument('--covered_data_id', type=int)
+        parser.add_argument('--resume', action='store_true', help='Resume any unfinished collections and keep their completed staging files')
+        parser.add_argument('--detach', action='store_true', help='Dispatch the collection without waiting to report progress')
+        parser.add_argument('--progress_interval', type=int, default=30, help='Seconds between progress reports')
+        parser.add_argument('--progress_timeout', type=int, default=settings.CWWED_COLLECTION_PROGRESS_TIMEOUT,
+                            help='Seconds to report progress before giving up (the collections keep running)')
 
     def handle(self, *args, **options):
         storm_filter_args = {'active': True}
@@ -27,16 +33,19 @@ class Command(BaseCommand):
             storm_filter_args.update(id=options['storm_id'])
         if options.get('covered_data_id'):
             covered_data_filter_args.update(id=options['covered_data_id'])
+        resume = options.get('resume', False)
+
+        # build a chain of providers for every storm's covered data which are all collected concurrently
+        chains = []
+        targets = []  # (storm, covered data, number of providers)
 
         for storm in NamedStorm.objects.filter(**storm_filter_args):
 
             self.stdout.write(self.style.SUCCESS('Named Storm: %s' % storm))
 
             # create output directories
-            complete_path = named_storm_covered_data_path(storm)
-            incomplete_path = named_storm_covered_data_incomplete_path(storm)
-            create_directory(complete_path)
-            create_directory(incomplete_path, remove_if_exists=True)
+            create_directory(named_storm_covered_data_path(storm))
+            create_directory(named_storm_covered_data_incomplete_path(storm))
 
             for data in storm.covered_data.filter(**covered_data_filter_args):
 
@@ -46,115 +55,76 @@ class Command(BaseCommand):
                         self.style.SUCCESS('\tSkipping already collected Covered Data: %s on %s' % (data, storm_covered_data.date_collected)))
                     continue
 
-                self.stdout.write(self.style.SUCCESS('\tCovered Data: %s' % data))
-
-                covered_data_success = False
-
-                providers = data.covereddataprovider_set.filter(active=True)
+                providers = list(data.covereddataprovider_set.filter(active=True))
 
-                if not providers.exists():
+                if not providers:
                     # no need to continue if there aren't any active providers for this covered data
-                    self.stdout.write(self.style.WARNING('\t\tNo providers available.  Skipping this covered data'))
+                    self.stdout.write(self.style.WARNING('\tNo providers available.  Skipping Covered Data: %s' % data))
                     continue
 
-                for provider in providers:
-
-                    log = NamedStormCoveredDataLog(
-                        named_storm=storm,
-                        covered_data=data,
-                        provider=provider,
-                    )
-
-                    self.stdout.write(self.style.SUCCESS('\t\tProvider: %s' % provider))
-
-                    factory_cls = processor_factory_class(provider)
-                    factory = factory_cls(storm, provider)  # type: ProcessorCoreFactory
-
-                    # fetch all the processors data
-                    try:
-                        processors_data = factory.processors_data()
-                    except Exception as e:
-                        # failed building processors data so log error and skip this provider
-                        logging.error(e)
-                        logging.error('Error building factory for {}'.format(provider))
-                        # save the log
-                        log.success = False
-                        log.exception = str(e)
-                        log.save()
-                        continue
-
-                    if not processors_data:
-                        self.stdout.write(self.style.WARNING('\t\tNo data provided.  Skipping provider'))
-                        continue
-
-                    # fetch data in parallel but wait for all tasks to complete and capture results
-                    task_group = celery.group([process_dataset_task.s(data) for data in processors_data])
-                    group_result = task_group()
-
-                    # handle exceptions from the individual task results
-                    try:
-                        tasks_results = group_result.get()
-                    except Exception as e:
-                        # failed running processor tasks so log error and skip this provider
-                        logging.error(e)
-                        logging.error('Error running tasks for {}'.format(provider))
-                        log.success = False
-                        log.exception = str(e)
-                        log.save()
-                        continue
-
-                    covered_data_success = group_result.successful()
-
-                    # save the log
-                    log.success = covered_data_success
-                    log.save()
-
-                    if covered_data_success:
-
-                        data_path = os.path.join(complete_path, data.name)
-                        data_path_incomplete = os.path.join(incomplete_path, data.name)
-
-                        try:
-                            # remove any previous version in the complete path
-                            if os.path.exists(data_path):
-                                shutil.rmtree(data_path)
-                            # move the covered data outputs from the incomplete/staging directory to the complete directory
-                            shutil.move(data_path_incomplete, complete_path)
-                        except OSError as e:
-                            logging.error(e)
-                            logging.error('Error moving path for {}'.format(provider))
-                            log.success = False
-                            log.exception = str(e)
-                            log.save()
-                            continue
-
-                        # set the date collected on the named storm covered data instance
-                        storm_covered_data.date_collected = datetime.utcnow()
-                        storm_covered_data.save()
-
-                        # create a task to archive the data
-                        archive_named_storm_covered_data_task.delay(
-                            named_storm_id=storm.id,
-                            covered_data_id=data.id,
-                            log_id=log.id,
-                        )
-
-                        # debug/output
-                        for result in tasks_results:
-                            self.stdout.write(self.style.WARNING('\t\tURL: %s' % result['url']))
-                            self.stdout.write(self.style.WARNING('\t\tOutput: %s' % result['output_path']))
-
-                        self.stdout.write(self.style.SUCCESS('\t\tSUCCESS'))
-
-                        # skip additional providers since this was successful
-                        break
-                    else:
-                        logging.error('Error collecting {} from {}'.format(data, provider))
-                        self.stdout.write(self.style.ERROR('\t\tFailed'))
-                        self.stdout.write(self.style.WARNING('\t\tTrying next provider'))
-
-                if not covered_data_success:
-                    logging.error('Error collecting {} from ALL providers'.format(data))
+                # start with the provider of an unfinished collection when resuming
+                resumable_collection = NamedStormCoveredDataCollection.resumable(storm, data) if resume else None
+                if resumable_collection and resumable_collection.provider in providers:
+                    providers.remove(resumable_collection.provider)
+                    providers.insert(0, resumable_collection.provider)
+                else:
+                    resumable_collection = None
+
+                self.stdout.write(self.style.SUCCESS('\tCovered Data: %s (%s)' % (data, ', '.join(str(p) for p in providers))))
+
+                chains.append(covered_data_collection_chain(storm, data, providers, resume=resumable_collection is not None))
+                targets.append((storm, data, len(providers)))
+
+        if not chains:
+            self.stdout.write(self.style.WARNING('Nothing to collect'))
+            return
+
+        started = timezone.now()
+        celery.group(chains).apply_async()
+
+        self.stdout.write(self.style.SUCCESS('Dispatched %s covered data collections' % len(chains)))
+
+        if options.get('detach'):
+            return
+
+        self._report_progress(targets, started, options['progress_interval'], options['progress_timeout'])
 
         if not settings.DEBUG:
             slack_channel('Finished collecting covered data', '#events')
+
+    def _report_progress(self, targets: list, started, interval: int, timeout: int):
+        """
+        Reports progress by querying the collection records (vs holding task results) until every covered data is finished
+        or the timeout is reached.
+        A covered data is finished once a provider was successful or every provider has failed.
+        """
+        deadline = time.time() + timeout
+        while True:
+            finished = []
+            for storm, data, provider_count in targets:
+                logs = NamedStormCoveredDataLog.objects.filter(named_storm=storm, covered_data=data, date__gte=started)
+                if logs.filter(success=True).exists():
+                    finished.append('\tSUCCESS: %s: %s' % (storm, data))
+                elif logs.count() >= provider_count:
+                    finished.append('\tFAILED: %s: %s' % (storm, data))
+
+            # summarize dataset statuses for the running collections
+            items = NamedStormCoveredDataCollectionItem.objects.filter(
+                collection__status=COLLECTION_STATUS_RUNNING,
+                collection__named_storm__in=set(t[0] for t in targets),
+            )
+            statuses = ', '.join('%s %s' % (s['status'], s['total']) for s in items.values('status').annotate(total=Count('id')).order_by('status'))
+
+            self.stdout.write(self.style.SUCCESS('Finished %s of %s covered data (datasets: %s)' % (len(finished), len(targets), statuses or 'none')))
+
+            if len(finished) == len(targets):
+                for line in finished:
+                    self.stdout.write(self.style.SUCCESS(line))
+                break
+
+            if time.time() >= deadline:
+                self.stdout.write(self.style.WARNING('Stopped reporting progress after %s seconds with %s covered data unfinished' % (
+                    timeout, len(targets) - len(finished))))
+                break
+
+            time.sleep(interval)
@@ -0,0 +1,56 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from named_storms.data.manifest import CoveredDataManifest
+from named_storms.models import NamedStorm
+from named_storms.utils import named_storm_covered_data_archive_path
+
+
+class Command(BaseCommand):
+    help = 'Report the bytes saved by the output profile for every collected Covered Data file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--storm_id', type=int)
+        parser.add_argument('--covered_data_id', type=int)
+
+    def handle(self, *args, **options):
+        storm_filter_args = {}
+        covered_data_filter_args = {}
+
+        # optional arguments
+        if options.get('storm_id'):
+            storm_filter_args.update(id=options['storm_id'])
+        if options.get('covered_data_id'):
+            covered_data_filter_args.update(id=options['covered_data_id'])
+
+        self.stdout.write(self.style.SUCCESS('Output profile: %s' % settings.CWWED_NETCDF_OUTPUT_PROFILE))
+
+        total_size = total_uncompressed_size = 0
+
+        for storm in NamedStorm.objects.filter(**storm_filter_args):
+            for data in storm.covered_data.filter(**covered_data_filter_args):
+
+                path = named_storm_covered_data_archive_path(storm, data)
+                if not os.path.exists(os.path.join(path, settings.CWWED_COVERED_DATA_MANIFEST_FILE_NAME)):
+                    continue
+
+                self.stdout.write(self.style.SUCCESS('%s: %s' % (storm, data)))
+
+                for entry in sorted(CoveredDataManifest.load(path).entries().values(), key=lambda e: e['path'] or ''):
+                    # only files rewritten by a processor have an uncompressed size to compare against
+                    if not entry['path'] or not entry.get('uncompressed_size'):
+                        continue
+                    total_size += entry['size']
+                    total_uncompressed_size += entry['uncompressed_size']
+                    self.stdout.write('\t%s: %s of %s bytes (%s)' % (
+                        entry['path'], entry['size'], entry['uncompressed_size'],
+                        self._savings(entry['uncompressed_size'], entry['size'])))
+
+        self.stdout.write(self.style.SUCCESS('Total: %s of %s bytes (%s)' % (
+            total_size, total_uncompressed_size, self._savings(total_uncompressed_size, total_size))))
+
+    @staticmethod
+    def _savings(uncompressed_size: int, size: int) -> str:
+        if not uncompressed_size:
+            return 'n/a'
+        return '{:.1%} saved'.format(1 - size / uncompressed_size)
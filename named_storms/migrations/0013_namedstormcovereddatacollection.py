@@ -0,0 +1,41 @@
+# Generated by Django 2.0.5 on 2026-10-19 14:12
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0012_namedstormcovereddata_date_collected'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NamedStormCoveredDataCollection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_completed', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('running', 'running'), ('complete', 'complete'), ('failed', 'failed')], default='running', max_length=20)),
+                ('covered_data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.CoveredData')),
+                ('log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='named_storms.NamedStormCoveredDataLog')),
+                ('named_storm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NamedStorm')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.CoveredDataProvider')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NamedStormCoveredDataCollectionItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processor_data', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('url', models.CharField(max_length=5000)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed'), ('skipped', 'skipped')], default='pending', max_length=20)),
+                ('result', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('exception', models.TextField(blank=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='named_storms.NamedStormCoveredDataCollection')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.0.5 on 2026-10-19 14:31
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0013_namedstormcovereddatacollection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='covereddata',
+            name='success_threshold',
+            field=models.FloatField(default=1.0, help_text='Ratio of datasets (0-1) which must be collected to accept a provider'),
+        ),
+        migrations.AddField(
+            model_name='namedstormcovereddatalog',
+            name='missing',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.5 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0014_auto_20261019_1431'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='covereddata',
+            name='provider_policy',
+            field=models.CharField(choices=[('SEQUENTIAL', 'SEQUENTIAL'), ('FASTEST', 'FASTEST')], default='SEQUENTIAL', help_text='How to choose between multiple active providers', max_length=50),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.5 on 2026-10-19 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0015_covereddata_provider_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='namedstormcovereddatacollectionitem',
+            name='size_estimate',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
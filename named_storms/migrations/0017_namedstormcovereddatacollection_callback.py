@@ -0,0 +1,24 @@
+# Generated by Django 2.0.5 on 2026-10-19 18:40
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0016_namedstormcovereddatacollectionitem_size_estimate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='namedstormcovereddatacollection',
+            name='callback',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='namedstormcovereddatacollection',
+            name='pending_tasks',
+            field=models.IntegerField(default=0),
+        ),
+    ]
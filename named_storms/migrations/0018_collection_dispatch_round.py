@@ -0,0 +1,32 @@
+# Generated by Django 2.0.5 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0017_namedstormcovereddatacollection_callback'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='namedstormcovereddatacollection',
+            name='pending_tasks',
+        ),
+        migrations.AddField(
+            model_name='namedstormcovereddatacollection',
+            name='dispatch_round',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='namedstormcovereddatacollectionitem',
+            name='dispatch_round',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='namedstormcovereddatacollectionitem',
+            name='settled',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.0.5 on 2026-10-19 21:40
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0018_collection_dispatch_round'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NamedStormCoveredDataRace',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider_ids', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('pending', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('failed', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('chain', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('covered_data', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.CoveredData')),
+                ('named_storm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='named_storms.NamedStorm')),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='named_storms.CoveredDataProvider')),
+            ],
+        ),
+    ]
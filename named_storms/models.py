@@ -1,5 +1,6 @@
 from datetime import datetime
 from django.contrib.gis.db import models
+from django.contrib.postgres.fields import JSONField
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -44,6 +45,50 @@ PROCESSOR_DATA_SOURCE_CHOICES = (
     PROCESSOR_DATA_SOURCE_FILE_HDF,
 )
 
+# provider policies
+PROVIDER_POLICY_SEQUENTIAL = 'SEQUENTIAL'  # try each provider in order until one succeeds
+PROVIDER_POLICY_FASTEST = 'FASTEST'  # race every provider's discovery and use the fastest complete listing
+
+# provider policy choices
+PROVIDER_POLICY_CHOICES = (
+    PROVIDER_POLICY_SEQUENTIAL,
+    PROVIDER_POLICY_FASTEST,
+)
+
+# collection statuses
+COLLECTION_STATUS_RUNNING = 'running'
+COLLECTION_STATUS_COMPLETE = 'complete'
+COLLECTION_STATUS_FAILED = 'failed'
+
+# collection status choices
+COLLECTION_STATUS_CHOICES = (
+    COLLECTION_STATUS_RUNNING,
+    COLLECTION_STATUS_COMPLETE,
+    COLLECTION_STATUS_FAILED,
+)
+
+# collection item statuses
+COLLECTION_ITEM_STATUS_PENDING = 'pending'
+COLLECTION_ITEM_STATUS_RUNNING = 'running'
+COLLECTION_ITEM_STATUS_DONE = 'done'
+COLLECTION_ITEM_STATUS_FAILED = 'failed'
+COLLECTION_ITEM_STATUS_SKIPPED = 'skipped'  # nothing was stored (i.e empty dataset)
+
+# collection item status choices
+COLLECTION_ITEM_STATUS_CHOICES = (
+    COLLECTION_ITEM_STATUS_PENDING,
+    COLLECTION_ITEM_STATUS_RUNNING,
+    COLLECTION_ITEM_STATUS_DONE,
+    COLLECTION_ITEM_STATUS_FAILED,
+    COLLECTION_ITEM_STATUS_SKIPPED,
+)
+
+# collection item statuses which don't need to be dispatched again
+COLLECTION_ITEM_FINISHED_STATUSES = (
+    COLLECTION_ITEM_STATUS_DONE,
+    COLLECTION_ITEM_STATUS_SKIPPED,
+)
+
 
 class NamedStorm(models.Model):
     covered_data = models.ManyToManyField(
@@ -65,6 +110,10 @@ class CoveredData(models.Model):
     description = models.TextField(blank=True)
     active = models.BooleanField(default=True)
     url = models.CharField(max_length=5000, blank=True, help_text='Product URL for this dataset')
+    success_threshold = models.FloatField(default=1.0, help_text='Ratio of datasets (0-1) which must be collected to accept a provider')
+    provider_policy = models.CharField(
+        max_length=50, choices=zip(PROVIDER_POLICY_CHOICES, PROVIDER_POLICY_CHOICES), default=PROVIDER_POLICY_SEQUENTIAL,
+        help_text='How to choose between multiple active providers')
 
     def __str__(self):
         return self.name
@@ -124,6 +173,7 @@ class NamedStormCoveredDataLog(models.Model):
     success = models.BooleanField(default=False)  # whether the covered data collection was a success
     snapshot = models.TextField(blank=True)  # the path to the covered data snapshot
     exception = models.TextField(blank=True)  # any error message during a failed collection
+    missing = JSONField(default=list, blank=True)  # urls of any datasets which failed to be collected
 
     def __str__(self):
         if self.success:
@@ -131,6 +181,71 @@ class NamedStormCoveredDataLog(models.Model):
         return 'Error:: {}: {}'.format(self.named_storm, self.covered_data)
 
 
+class NamedStormCoveredDataCollection(models.Model):
+    """
+    A single collection run of a storm's covered data from a particular provider.
+    Each processor data item is tracked individually so an interrupted collection can be resumed.
+    """
+    named_storm = models.ForeignKey(NamedStorm, on_delete=models.CASCADE)
+    covered_data = models.ForeignKey(CoveredData, on_delete=models.CASCADE)
+    provider = models.ForeignKey(CoveredDataProvider, on_delete=models.CASCADE)
+    log = models.ForeignKey(NamedStormCoveredDataLog, null=True, blank=True, on_delete=models.SET_NULL)  # set once the collection finishes
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_completed = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=zip(COLLECTION_STATUS_CHOICES, COLLECTION_STATUS_CHOICES), default=COLLECTION_STATUS_RUNNING)
+    dispatch_round = models.IntegerField(default=0)  # incremented every time the unfinished datasets are dispatched
+    callback = JSONField(null=True, blank=True)  # serialized signature to run once the current round's datasets have settled
+
+    def __str__(self):
+        return '{}: {} ({})'.format(self.named_storm, self.covered_data, self.status)
+
+    @staticmethod
+    def resumable(named_storm: NamedStorm, covered_data: CoveredData):
+        """
+        :return: most recent unfinished collection for a particular storm and covered data
+        :rtype named_storm.models.NamedStormCoveredDataCollection
+        """
+        return named_storm.namedstormcovereddatacollection_set.filter(
+            covered_data=covered_data, status=COLLECTION_STATUS_RUNNING).order_by('-date_created').first()
+
+
+class NamedStormCoveredDataCollectionItem(models.Model):
+    """
+    An individual processor data item (i.e a single dataset) in a collection run
+    """
+    collection = models.ForeignKey(NamedStormCoveredDataCollection, on_delete=models.CASCADE, related_name='items')
+    processor_data = JSONField()  # serialized ProcessorData which is passed to the processor task
+    url = models.CharField(max_length=5000)
+    status = models.CharField(max_length=20, choices=zip(COLLECTION_ITEM_STATUS_CHOICES, COLLECTION_ITEM_STATUS_CHOICES), default=COLLECTION_ITEM_STATUS_PENDING)
+    result = JSONField(null=True, blank=True)  # processor output once the item is done
+    exception = models.TextField(blank=True)  # any error message during a failed attempt
+    size_estimate = models.BigIntegerField(null=True, blank=True)  # estimated size in bytes used to schedule the largest items first
+    dispatch_round = models.IntegerField(default=0)  # collection's dispatch round this item was last dispatched in
+    settled = models.BooleanField(default=False)  # whether this item's task has finished (or was lost) for its dispatch round
+    date_updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{}: {}'.format(self.url, self.status)
+
+
+class NamedStormCoveredDataRace(models.Model):
+    """
+    A race between every provider's discovery for a storm's covered data (see PROVIDER_POLICY_FASTEST).
+    The discoveries report to this record (under a row lock) so the first complete listing wins.
+    """
+    named_storm = models.ForeignKey(NamedStorm, on_delete=models.CASCADE)
+    covered_data = models.ForeignKey(CoveredData, on_delete=models.CASCADE)
+    provider_ids = JSONField()  # every provider in the race in order of preference
+    pending = JSONField()  # provider id => task id for the discoveries which haven't reported yet
+    failed = JSONField(default=list)  # provider ids whose discovery failed
+    winner = models.ForeignKey(CoveredDataProvider, null=True, blank=True, on_delete=models.SET_NULL)
+    chain = JSONField()  # serialized signatures which continue the chain once the race is decided
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{}: {} ({})'.format(self.named_storm, self.covered_data, self.winner or 'undecided')
+
+
 class NSEM(models.Model):
     """
     Named Storm Event Model
@@ -1,24 +1,43 @@
 from __future__ import absolute_import, unicode_literals
 import json
-from datetime import datetime
+import math
+import logging
+import shutil
+import uuid
+from datetime import datetime, timedelta
 from django.contrib.auth.models import User
 import os
 import tarfile
-import requests
+import celery
+from celery.exceptions import Ignore
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import F
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
 
 from cwwed.celery import app
 from cwwed.storage_backends import S3ObjectStoragePrivate
 from named_storms.api.serializers import NSEMSerializer
-from named_storms.data.processors import ProcessorData
-from named_storms.models import NamedStorm, CoveredDataProvider, CoveredData, NamedStormCoveredDataLog, NSEM
+from named_storms.archive import ARCHIVE_EXTENSIONS, archive_extension, archive_index_path, archive_reader, write_archive
+from named_storms.data import scratch
+from named_storms.data.connections import http_session
+from named_storms.data.manifest import CoveredDataManifest
+from named_storms.data.memory import MemoryBudgetExceeded, memory_reservation
+from named_storms.data.processors import GenericFileProcessor, ProcessorData
+from named_storms.models import (
+    NamedStorm, CoveredDataProvider, CoveredData, NamedStormCoveredDataLog, NSEM, NamedStormCoveredData, NamedStormCoveredDataCollection,
+    NamedStormCoveredDataCollectionItem, NamedStormCoveredDataRace, COLLECTION_ITEM_STATUS_PENDING, COLLECTION_ITEM_STATUS_RUNNING,
+    COLLECTION_ITEM_STATUS_DONE, COLLECTION_ITEM_STATUS_FAILED, COLLECTION_ITEM_STATUS_SKIPPED, COLLECTION_ITEM_FINISHED_STATUSES,
+    COLLECTION_STATUS_COMPLETE, COLLECTION_STATUS_FAILED, COLLECTION_STATUS_RUNNING, PROVIDER_POLICY_FASTEST,
+)
 from named_storms.utils import (
-    processor_class, named_storm_covered_data_archive_path, copy_path_to_default_storage, named_storm_nsem_version_path,
-    get_superuser_emails,
+    processor_class, processor_factory_class, named_storm_covered_data_archive_path, named_storm_covered_data_path,
+    named_storm_nsem_version_path, named_storm_covered_data_incomplete_path, create_directory, get_superuser_emails,
 )
 
 
@@ -35,9 +54,9 @@ def fetch_url_task(url, verify=True, write_to_path=None):
     :param url: URL to fetch
     :param verify: whether to verify ssl
     :param write_to_path: path to store the output vs returning it
+    :return: the content when it's small, otherwise a reference to it in the scratch store (see `scratch.get_json`)
     """
-    stream = write_to_path is not None
-    response = requests.get(url, verify=verify, timeout=10, stream=stream)
+    response = http_session(url, verify=verify).get(url, timeout=10, stream=True)
     response.raise_for_status()
 
     # save content
@@ -47,29 +66,602 @@ def fetch_url_task(url, verify=True, write_to_path=None):
                 f.write(chunk)
         return None
 
+    # buffer the content but spill it to the scratch store once it's too large to pass through the result backend
+    content = b''
+    chunks = response.iter_content(chunk_size=64 * 1024)
+    for chunk in chunks:
+        content += chunk
+        if len(content) > settings.CWWED_TASK_RESULT_INLINE_BYTES:
+            create_directory(settings.CWWED_SCRATCH_DIR)
+            path = scratch.new_path('xml')
+            with open(path, 'wb') as f:
+                f.write(content)
+                for remaining_chunk in chunks:
+                    f.write(remaining_chunk)
+            return scratch.reference(path)
+
     # return content
-    return response.content.decode()  # must return bytes for serialization
+    return content.decode()  # must return bytes for serialization
 
 
-@app.task(**TASK_ARGS)
-def process_dataset_task(data: list):
+@app.task(bind=True, **TASK_ARGS)
+def process_dataset_task(self, data: list, collection_item_id=None, dispatch_round=None):
     """
     Run the dataset processor
+    :param data: serialized ProcessorData
+    :param collection_item_id: optional id for a NamedStormCoveredDataCollectionItem to track this dataset's status.
+    Tracked datasets don't raise once their retries are exhausted so the rest of the collection can continue,
+    and the last of a collection's dispatched datasets to settle runs the collection's callback (see `_dispatch_collection`).
+    :param dispatch_round: the collection's dispatch round this task belongs to
+    Datasets refused by the worker's memory budget are rerouted to the high memory workers without spending their retries.
     """
+    collection_item = None
+    try:
+        if collection_item_id is not None:
+            collection_item = get_object_or_404(NamedStormCoveredDataCollectionItem, pk=collection_item_id)
+            collection_item.status = COLLECTION_ITEM_STATUS_RUNNING
+            collection_item.save()
+        result = _process_dataset(data)
+    except MemoryBudgetExceeded as e:
+        logging.warning('{} (rerouting to {})'.format(e, settings.CWWED_QUEUE_HIGH_MEMORY))
+        if collection_item is not None:
+            collection_item.status = COLLECTION_ITEM_STATUS_PENDING
+            collection_item.exception = str(e)
+            collection_item.save()
+        # publish a copy (keeping the retries so far) rather than retrying which would spend the retry budget on the same queue
+        process_dataset_task.apply_async(
+            self.request.args, self.request.kwargs, queue=settings.CWWED_QUEUE_HIGH_MEMORY, retries=self.request.retries,
+            countdown=settings.CWWED_WORKER_MEMORY_REROUTE_DELAY, priority=(self.request.delivery_info or {}).get('priority'))
+        # return (vs raising Ignore) since any exception would be autoretried
+        return None
+    except Exception as e:
+        if collection_item is not None:
+            collection_item.status = COLLECTION_ITEM_STATUS_FAILED
+            collection_item.exception = str(e)
+            collection_item.save()
+            # the failure is recorded on the collection item so don't fail the collection
+            if self.request.retries >= self.max_retries:
+                logging.error('Error collecting {}: {}'.format(collection_item.url, e))
+                _collection_item_settled(collection_item, dispatch_round)
+                return None
+        raise
+
+    if collection_item is not None:
+        # "skipped" when nothing was stored (i.e empty dataset)
+        collection_item.status = COLLECTION_ITEM_STATUS_DONE if result['manifest']['path'] else COLLECTION_ITEM_STATUS_SKIPPED
+        collection_item.result = result
+        collection_item.exception = ''
+        collection_item.save()
+        _collection_item_settled(collection_item, dispatch_round)
+        # the result is recorded on the collection item so only return a reference to it
+        return {'collection_item_id': collection_item.id, 'status': collection_item.status}
+
+    return result
+
+
+def _process_dataset(data: list) -> dict:
     processor_data = ProcessorData(*data)
     named_storm = get_object_or_404(NamedStorm, pk=processor_data.named_storm_id)
     provider = get_object_or_404(CoveredDataProvider, pk=processor_data.provider_id)
     processor_cls = processor_class(provider)
-    processor = processor_cls(
+
+    # refuse to start if the processor's estimated peak memory would exceed this worker's memory budget
+    with memory_reservation(processor_cls.estimate_peak_memory(processor_data), processor_data.url):
+        processor = processor_cls(
+            named_storm=named_storm,
+            provider=provider,
+            url=processor_data.url,
+            label=processor_data.label,
+            group=processor_data.group,
+            **processor_data.kwargs,  # include any extra kwargs
+        )
+        processor.fetch()
+        return processor.to_dict()
+
+
+@app.task(bind=True)
+def collect_covered_data_provider_task(self, previous_success: bool, named_storm_id, covered_data_id, provider_id, resume=False):
+    """
+    Collects a storm's covered data from a single provider.
+    The providers for a covered data are chained in order, so this is skipped once a previous provider was successful.
+    This task dispatches the provider's datasets and the last one to finish runs `collect_covered_data_finalize_task`.
+    :param previous_success: whether a previous provider in the chain was successful
+    :param named_storm_id: id for a NamedStorm record
+    :param covered_data_id: id for a CoveredData record
+    :param provider_id: id for a CoveredDataProvider record
+    :param resume: whether to resume an unfinished collection for this provider
+    :return: whether the covered data was successfully collected
+    """
+    if previous_success:
+        return True
+
+    named_storm = get_object_or_404(NamedStorm, pk=named_storm_id)
+    covered_data = get_object_or_404(CoveredData, pk=covered_data_id)
+    provider = get_object_or_404(CoveredDataProvider, pk=provider_id)
+
+    collection = NamedStormCoveredDataCollection.resumable(named_storm, covered_data) if resume else None
+
+    if collection is None or collection.provider != provider:
+
+        # start from a clean staging directory
+        create_directory(_covered_data_incomplete_path(named_storm, covered_data), remove_if_exists=True)
+
+        # fetch all the processors data
+        try:
+            processors_data = _provider_processors_data(named_storm, provider)
+        except Exception as e:
+            # failed building processors data so log error and skip this provider
+            logging.error(e)
+            logging.error('Error building factory for {}'.format(provider))
+            _log_provider_failure(named_storm, covered_data, provider, str(e))
+            return False
+
+        if not processors_data:
+            _log_provider_failure(named_storm, covered_data, provider, 'No data provided')
+            return False
+
+        collection = _create_collection(named_storm, covered_data, provider, processors_data)
+
+    return _dispatch_collection(self, collection, attempt=0, failure_budget=settings.CWWED_COLLECTION_FAILURE_BUDGET)
+
+
+@app.task(bind=True)
+def collect_covered_data_race_task(self, named_storm_id, covered_data_id, provider_ids: list):
+    """
+    Races every provider's discovery concurrently and collects from the one which answers first with a complete listing.
+    Each discovery reports back to the race (see `provider_discovery_task`) and the first complete listing continues the chain.
+    The remaining providers are only used as (sequential) fallbacks, including every unfinished provider if the race times out.
+    :param named_storm_id: id for a NamedStorm record
+    :param covered_data_id: id for a CoveredData record
+    :param provider_ids: list of ids for CoveredDataProvider records
+    """
+    named_storm = get_object_or_404(NamedStorm, pk=named_storm_id)
+    covered_data = get_object_or_404(CoveredData, pk=covered_data_id)
+
+    discovery_ids = dict((str(provider_id), uuid.uuid4().hex) for provider_id in provider_ids)
+
+    # record the race before dispatching so even the quickest discovery can report to it
+    race = NamedStormCoveredDataRace.objects.create(
+        named_storm=named_storm,
+        covered_data=covered_data,
+        provider_ids=provider_ids,
+        pending=discovery_ids,
+        # the running task's chain is stored in reverse order
+        chain=[dict(celery.signature(sig, app=app)) for sig in reversed(self.request.chain or [])],
+    )
+
+    for provider_id in provider_ids:
+        provider_discovery_task.apply_async((named_storm_id, covered_data_id, provider_id, race.id), task_id=discovery_ids[str(provider_id)])
+    provider_race_timeout_task.apply_async((race.id,), countdown=settings.CWWED_PROVIDER_RACE_TIMEOUT)
+
+    # the race continues the chain so stop it here
+    self.request.chain = None
+    raise Ignore()
+
+
+@app.task(bind=True)
+def provider_discovery_task(self, named_storm_id, covered_data_id, provider_id, race_id):
+    """
+    Builds a provider's list of datasets and reports it to the race.
+    The first complete (successful and non-empty) listing wins and collects, while later listings are discarded.
+    """
+    named_storm = get_object_or_404(NamedStorm, pk=named_storm_id)
+    covered_data = get_object_or_404(CoveredData, pk=covered_data_id)
+    provider = get_object_or_404(CoveredDataProvider, pk=provider_id)
+
+    try:
+        processors_data = _provider_processors_data(named_storm, provider)
+        exception = None if processors_data else 'No data provided'
+    except Exception as e:
+        logging.error('Error building factory for {}: {}'.format(provider, e))
+        processors_data = None
+        exception = str(e)
+
+    # only the bookkeeping happens under the race's row lock
+    with transaction.atomic():
+        race = NamedStormCoveredDataRace.objects.select_for_update().filter(pk=race_id).first()
+
+        # the race was already decided (or timed out) without this provider
+        if race is None or str(provider_id) not in race.pending:
+            return None
+
+        del race.pending[str(provider_id)]
+        if exception is not None:
+            race.failed.append(provider_id)
+        won = exception is None and race.winner_id is None
+        if won:
+            race.winner = provider
+        race.save()
+
+    if exception is not None:
+        _log_provider_failure(named_storm, covered_data, provider, exception)
+        # every provider failed so continue the chain unsuccessfully
+        if not race.pending and race.winner_id is None:
+            celery.chain(*_race_chain(race)).apply_async((False,))
+        return None
+
+    if not won:
+        return None
+
+    # cancel the slower discoveries
+    app.control.revoke(list(race.pending.values()), terminate=True)
+
+    # fallback to the remaining providers in order if the winner fails to collect (excluding any which already failed discovery)
+    fallbacks = [
+        collect_covered_data_provider_task.s(named_storm_id, covered_data_id, fallback_id) for fallback_id in race.provider_ids
+        if fallback_id != provider_id and fallback_id not in race.failed]
+
+    create_directory(_covered_data_incomplete_path(named_storm, covered_data), remove_if_exists=True)
+    collection = _create_collection(named_storm, covered_data, provider, processors_data)
+
+    return _dispatch_collection(
+        self, collection, attempt=0, failure_budget=settings.CWWED_COLLECTION_FAILURE_BUDGET, fallbacks=fallbacks,
+        chain=_race_chain(race))
+
+
+@app.task()
+def provider_race_timeout_task(race_id):
+    """
+    Ends a race which no provider has won in time.
+    The unfinished discoveries are cancelled and those providers are collected sequentially as fallbacks instead.
+    """
+    with transaction.atomic():
+        race = NamedStormCoveredDataRace.objects.select_for_update().filter(pk=race_id).first()
+        if race is None or race.winner_id is not None or not race.pending:
+            return False
+        pending = race.pending
+        race.pending = {}
+        race.save()
+
+    logging.warning('Timed out racing providers for {} {}'.format(race.named_storm, race.covered_data))
+    app.control.revoke(list(pending.values()), terminate=True)
+
+    # providers fall back sequentially in their original order
+    provider_ids = [provider_id for provider_id in race.provider_ids if str(provider_id) in pending]
+    tasks = [collect_covered_data_provider_task.s(False, race.named_storm_id, race.covered_data_id, provider_ids[0])]
+    tasks += [collect_covered_data_provider_task.s(race.named_storm_id, race.covered_data_id, provider_id) for provider_id in provider_ids[1:]]
+    celery.chain(*tasks, *_race_chain(race)).apply_async()
+
+    return True
+
+
+@app.task(bind=True)
+def collect_covered_data_finalize_task(self, collection_id, attempt: int, failure_budget: int):
+    """
+    Runs once all of a collection's dispatched datasets have finished.
+    Only the failed datasets are dispatched again (with exponential backoff) until the retry rounds or failure budget are spent.
+    :param collection_id: id for a NamedStormCoveredDataCollection record
+    :param attempt: number of retry rounds so far
+    :param failure_budget: remaining number of dataset retries
+    :return: whether the covered data was successfully collected
+    """
+    collection = get_object_or_404(NamedStormCoveredDataCollection, pk=collection_id)
+
+    pending = collection.items.exclude(status__in=COLLECTION_ITEM_FINISHED_STATUSES).count()
+    if pending and attempt < settings.CWWED_COLLECTION_RETRY_ROUNDS and pending <= failure_budget:
+        return _dispatch_collection(
+            self, collection, attempt=attempt + 1, failure_budget=failure_budget - pending,
+            countdown=settings.CWWED_COLLECTION_RETRY_BACKOFF * 2 ** attempt)
+
+    return _finalize_collection(collection)
+
+
+@app.task()
+def collect_covered_data_watchdog_task(collection_id, dispatch_round: int):
+    """
+    Settles a dispatch round's datasets whose task was lost (i.e the worker was killed or the task revoked) as failed,
+    so the collection's callback always runs.  Reschedules itself until the round has settled.
+    :param collection_id: id for a NamedStormCoveredDataCollection record
+    :param dispatch_round: the collection's dispatch round to watch
+    """
+    collection = get_object_or_404(NamedStormCoveredDataCollection, pk=collection_id)
+    if collection.dispatch_round != dispatch_round or collection.callback is None:
+        return True
+
+    # a lost task never updates its item again
+    lost = collection.items.filter(
+        dispatch_round=dispatch_round, settled=False,
+        date_updated__lt=timezone.now() - timedelta(seconds=settings.CWWED_COLLECTION_ITEM_TIMEOUT))
+    for collection_item in lost:
+        logging.error('Lost the task collecting {}'.format(collection_item.url))
+    lost.exclude(status__in=COLLECTION_ITEM_FINISHED_STATUSES).update(
+        status=COLLECTION_ITEM_STATUS_FAILED, exception='Task was lost (i.e the worker was killed)')
+    lost.update(settled=True)
+
+    if _run_collection_callback(collection_id, dispatch_round):
+        return True
+
+    collect_covered_data_watchdog_task.apply_async(
+        (collection_id, dispatch_round), countdown=settings.CWWED_COLLECTION_WATCHDOG_INTERVAL)
+    return False
+
+
+@app.task()
+def collect_covered_data_complete_task(success: bool, named_storm_id, covered_data_id):
+    """
+    Runs at the end of a covered data's provider chain
+    """
+    if not success:
+        logging.error('Error collecting {} for {} from ALL providers'.format(
+            get_object_or_404(CoveredData, pk=covered_data_id), get_object_or_404(NamedStorm, pk=named_storm_id)))
+    # clean up any scratch results which were never resolved and partial downloads which were never retried
+    scratch.purge_stale()
+    GenericFileProcessor.purge_stale_partial_files(get_object_or_404(NamedStorm, pk=named_storm_id))
+    return success
+
+
+@app.task()
+def refresh_active_storms_task():
+    """
+    Periodically (via celery beat) re-collects every active storm's covered data whose time window
+    reached the present as of its last collection.
+    Datasets whose upstream hasn't changed are linked from the previous collection so only new or changed datasets are fetched.
+    """
+    today = timezone.now().date()
+    chains = []
+
+    for storm in NamedStorm.objects.filter(active=True):
+        create_directory(named_storm_covered_data_path(storm))
+        create_directory(named_storm_covered_data_incomplete_path(storm))
+
+        for storm_covered_data in storm.namedstormcovereddata_set.filter(covered_data__active=True):
+            covered_data = storm_covered_data.covered_data
+
+            # the time window was already complete when it was last collected
+            date_collected = storm_covered_data.date_collected
+            if date_collected and storm_covered_data.date_end and storm_covered_data.date_end.date() < date_collected:
+                continue
+
+            # don't overlap a collection which is still running
+            running = NamedStormCoveredDataCollection.objects.filter(
+                named_storm=storm, covered_data=covered_data, status=COLLECTION_STATUS_RUNNING)
+            abandoned = running.filter(date_created__lt=timezone.now() - timedelta(seconds=settings.CWWED_REFRESH_RUNNING_TIMEOUT))
+            abandoned.update(status=COLLECTION_STATUS_FAILED, callback=None)
+            if running.exists():
+                continue
+
+            providers = list(covered_data.covereddataprovider_set.filter(active=True))
+            if not providers:
+                continue
+
+            chains.append(covered_data_collection_chain(storm, covered_data, providers))
+
+    if chains:
+        celery.group(chains).apply_async()
+
+    logging.info('Refreshing {} covered data collections for active storms on {}'.format(len(chains), today))
+
+    return len(chains)
+
+
+def covered_data_collection_chain(named_storm: NamedStorm, covered_data: CoveredData, providers: list, resume=False) -> celery.chain:
+    """
+    Builds the chain which collects a storm's covered data from its providers followed by `collect_covered_data_complete_task`
+    :param providers: list of CoveredDataProvider records in order of preference
+    :param resume: whether the first provider should resume its unfinished collection
+    """
+    if covered_data.provider_policy == PROVIDER_POLICY_FASTEST and len(providers) > 1 and not resume:
+        # race every provider's discovery and collect from the fastest
+        tasks = [collect_covered_data_race_task.s(named_storm.id, covered_data.id, [provider.id for provider in providers])]
+    else:
+        # providers fall back sequentially, so each provider task receives whether the previous one was successful
+        tasks = [collect_covered_data_provider_task.s(False, named_storm.id, covered_data.id, providers[0].id, resume)]
+        tasks += [collect_covered_data_provider_task.s(named_storm.id, covered_data.id, provider.id, resume) for provider in providers[1:]]
+    tasks.append(collect_covered_data_complete_task.s(named_storm.id, covered_data.id))
+    return celery.chain(*tasks)
+
+
+def _covered_data_incomplete_path(named_storm: NamedStorm, covered_data: CoveredData) -> str:
+    return os.path.join(named_storm_covered_data_incomplete_path(named_storm), covered_data.name)
+
+
+def _provider_processors_data(named_storm: NamedStorm, provider: CoveredDataProvider) -> list:
+    factory_cls = processor_factory_class(provider)
+    factory = factory_cls(named_storm, provider)
+    return factory.processors_data()
+
+
+def _race_chain(race: NamedStormCoveredDataRace) -> list:
+    """
+    :return: the signatures which continue the chain once the race is decided
+    """
+    return [celery.signature(sig, app=app) for sig in race.chain]
+
+
+def _log_provider_failure(named_storm: NamedStorm, covered_data: CoveredData, provider: CoveredDataProvider, exception: str):
+    NamedStormCoveredDataLog.objects.create(
         named_storm=named_storm,
+        covered_data=covered_data,
         provider=provider,
-        url=processor_data.url,
-        label=processor_data.label,
-        group=processor_data.group,
-        **processor_data.kwargs,  # include any extra kwargs
+        success=False,
+        exception=exception,
     )
-    processor.fetch()
-    return processor.to_dict()
+
+
+def _create_collection(named_storm: NamedStorm, covered_data: CoveredData, provider: CoveredDataProvider, processors_data: list):
+    # persist the collection and each of its items so it can be resumed
+    collection = NamedStormCoveredDataCollection.objects.create(
+        named_storm=named_storm,
+        covered_data=covered_data,
+        provider=provider,
+    )
+    for processor_data in processors_data:
+        collection.items.create(processor_data=processor_data, url=processor_data.url, size_estimate=processor_data.size)
+    return collection
+
+
+def _dispatch_collection(task: celery.Task, collection: NamedStormCoveredDataCollection, attempt: int, failure_budget: int,
+                         countdown=None, fallbacks: list = None, chain: list = None):
+    """
+    Dispatches the collection's unfinished datasets and hands the running task's chain over to the collection.
+    The last dataset to settle runs the finalize task followed by any remaining tasks in the running task's chain (i.e fallback providers).
+    Chords aren't used since the (rpc) result backend doesn't support them, and a watchdog settles datasets whose task was lost.
+    :param fallbacks: optional list of provider task signatures to chain after the finalize task
+    :param chain: optional list of task signatures to run last (defaults to the running task's chain)
+    """
+    pending_items = collection.items.exclude(status__in=COLLECTION_ITEM_FINISHED_STATUSES)
+
+    if not pending_items.exists() and not fallbacks and chain is None:
+        return _finalize_collection(collection)
+
+    # dispatch the largest datasets first (and with higher priority) so a few large datasets don't start last and decide the makespan
+    pending_items = list(pending_items.order_by(F('size_estimate').desc(nulls_last=True), 'id'))
+    body = collect_covered_data_finalize_task.si(collection.id, attempt, failure_budget)
+
+    # the running task's chain is stored in reverse order
+    if chain is None:
+        chain = [celery.signature(sig, app=app) for sig in reversed(task.request.chain or [])]
+    callback = celery.chain(body, *(fallbacks or []), *chain)
+
+    # the callback includes the rest of the running task's chain
+    task.request.chain = None
+
+    if not pending_items:
+        raise task.replace(callback)
+
+    # start a new dispatch round (so stale tasks from a previous round are ignored) and record the callback
+    # before dispatching so even the quickest dataset can run it
+    with transaction.atomic():
+        collection = NamedStormCoveredDataCollection.objects.select_for_update().get(pk=collection.id)
+        collection.dispatch_round += 1
+        collection.callback = json.loads(json.dumps(callback))
+        collection.save()
+        collection.items.filter(pk__in=[item.id for item in pending_items]).update(
+            dispatch_round=collection.dispatch_round, settled=False, date_updated=timezone.now())
+
+    processor_cls = processor_class(collection.provider)
+    header = [
+        process_dataset_task.s(item.processor_data, item.id, collection.dispatch_round).set(
+            countdown=countdown, priority=_dataset_priority(item.size_estimate), queue=_dataset_queue(processor_cls, item.processor_data))
+        for item in pending_items]
+    celery.group(header).apply_async()
+
+    # settle any datasets whose task is lost (i.e the worker was killed) so the collection always continues
+    collect_covered_data_watchdog_task.apply_async(
+        (collection.id, collection.dispatch_round), countdown=(countdown or 0) + settings.CWWED_COLLECTION_WATCHDOG_INTERVAL)
+
+    # the collection's callback continues the chain so stop it here
+    raise Ignore()
+
+
+def _collection_item_settled(collection_item: NamedStormCoveredDataCollectionItem, dispatch_round: int):
+    """
+    Settles the item for its dispatch round (only once, and never for a stale round) and runs the collection's callback
+    once every dataset of the round has settled
+    """
+    settled = NamedStormCoveredDataCollectionItem.objects.filter(
+        pk=collection_item.id, dispatch_round=dispatch_round, settled=False).update(settled=True)
+    if settled:
+        _run_collection_callback(collection_item.collection_id, dispatch_round)
+
+
+def _run_collection_callback(collection_id: int, dispatch_round: int) -> bool:
+    """
+    Runs the collection's callback (only once) when every dataset of the dispatch round has settled
+    :return: whether the round is over
+    """
+    with transaction.atomic():
+        collection = NamedStormCoveredDataCollection.objects.select_for_update().get(pk=collection_id)
+        if collection.dispatch_round != dispatch_round or collection.callback is None:
+            return True
+        if collection.items.filter(dispatch_round=dispatch_round, settled=False).exists():
+            return False
+        callback = collection.callback
+        collection.callback = None
+        collection.save(update_fields=['callback'])
+
+    celery.signature(callback, app=app).apply_async()
+    return True
+
+
+def _dataset_queue(processor_cls, data: list) -> str:
+    """
+    :return: queue for a dataset based on its processor's estimated peak memory and whether it's cpu bound
+    """
+    if processor_cls.estimate_peak_memory(ProcessorData(*data)) > settings.CWWED_HIGH_MEMORY_THRESHOLD:
+        return settings.CWWED_QUEUE_HIGH_MEMORY
+    # cpu bound processors are sent to the cpu queue (vs the default, network bound, io queue)
+    if processor_cls.CPU_BOUND:
+        return settings.CWWED_QUEUE_CPU
+    return settings.CWWED_QUEUE_IO
+
+
+def _dataset_priority(size: int) -> int:
+    """
+    :return: celery priority which scales with the order of magnitude of the dataset's size (unknown sizes get the lowest)
+    """
+    if not size:
+        return 0
+    # i.e 1KB => 0, 10MB => 4, 1GB => 6
+    return max(0, min(settings.CWWED_TASK_MAX_PRIORITY, int(math.log10(size)) - 3))
+
+
+def _finalize_collection(collection: NamedStormCoveredDataCollection) -> bool:
+    """
+    Accepts the collection if enough of its datasets were collected and moves the staging files into the complete directory
+    :return: whether the covered data was successfully collected
+    """
+    named_storm = collection.named_storm
+    covered_data = collection.covered_data
+
+    log = NamedStormCoveredDataLog(
+        named_storm=named_storm,
+        covered_data=covered_data,
+        provider=collection.provider,
+    )
+
+    missing = [item.url for item in collection.items.exclude(status__in=COLLECTION_ITEM_FINISHED_STATUSES)]
+    total = collection.items.count()
+    success_ratio = (total - len(missing)) / total if total else 0
+
+    # accept the provider when enough of the datasets were collected
+    log.success = success_ratio >= covered_data.success_threshold
+    log.missing = missing
+    if missing:
+        log.exception = '\n'.join(set(collection.items.exclude(exception='').values_list('exception', flat=True)))
+
+    if log.success:
+        data_path = named_storm_covered_data_archive_path(named_storm, covered_data)
+        data_path_incomplete = _covered_data_incomplete_path(named_storm, covered_data)
+
+        try:
+            # record every collected file in the covered data's manifest so future collections only fetch what changed
+            manifest = CoveredDataManifest(create_directory(data_path_incomplete))
+            for item in collection.items.filter(status__in=COLLECTION_ITEM_FINISHED_STATUSES):
+                manifest.add(item.result['manifest'])
+            manifest.save()
+            # remove any previous version in the complete path
+            if os.path.exists(data_path):
+                shutil.rmtree(data_path)
+            # move the covered data outputs from the incomplete/staging directory to the complete directory
+            shutil.move(data_path_incomplete, os.path.dirname(data_path))
+        except OSError as e:
+            logging.error(e)
+            logging.error('Error moving path for {}'.format(collection.provider))
+            log.success = False
+            log.exception = str(e)
+
+    log.save()
+
+    collection.log = log
+    collection.status = COLLECTION_STATUS_COMPLETE if log.success else COLLECTION_STATUS_FAILED
+    collection.date_completed = datetime.utcnow()
+    collection.save()
+
+    if log.success:
+        # set the date collected on the named storm covered data instance
+        NamedStormCoveredData.objects.filter(named_storm=named_storm, covered_data=covered_data).update(date_collected=datetime.utcnow())
+
+        # create a task to archive the data
+        archive_named_storm_covered_data_task.delay(
+            named_storm_id=named_storm.id,
+            covered_data_id=covered_data.id,
+            log_id=log.id,
+        )
+    else:
+        logging.error('Error collecting {} from {}'.format(covered_data, collection.provider))
+
+    return log.success
 
 
 @app.task(**TASK_ARGS)
@@ -85,30 +677,28 @@ def archive_named_storm_covered_data_task(named_storm_id, covered_data_id, log_i
     log = get_object_or_404(NamedStormCoveredDataLog, pk=log_id)
 
     archive_path = named_storm_covered_data_archive_path(named_storm, covered_data)
-    tar_path = '{}.{}'.format(
-        os.path.join(os.path.dirname(archive_path), os.path.basename(archive_path)),  # guarantees no trailing slash
-        settings.CWWED_ARCHIVE_EXTENSION,
+    tar_name = '{}.{}'.format(
+        os.path.basename(os.path.normpath(archive_path)),  # guarantees no trailing slash
+        archive_extension(),
     )
 
-    # create tar in local storage
-    tar = tarfile.open(tar_path, mode=settings.CWWED_NSEM_ARCHIVE_WRITE_MODE)
-    tar.add(archive_path, arcname=os.path.basename(archive_path))
-    tar.close()
-
     storage_path = os.path.join(
         settings.CWWED_COVERED_ARCHIVE_DIR_NAME,
         named_storm.name,
-        os.path.basename(tar_path),
+        tar_name,
     )
 
-    # copy tar to object storage
-    snapshot_path = copy_path_to_default_storage(tar_path, storage_path)
+    storage = S3ObjectStoragePrivate()
+
+    # stream the tar through the (parallel) compression straight into a multipart upload so nothing is written locally
+    with storage.multipart_upload(storage_path) as upload:
+        index = write_archive(upload, archive_path, os.path.basename(os.path.normpath(archive_path)))
 
-    # remove local tar
-    os.remove(tar_path)
+    # store the index of every file's compressed byte range alongside the archive so single files can be retrieved
+    storage.save(archive_index_path(storage_path), ContentFile(json.dumps(index).encode()))
 
     # update the log with the saved snapshot
-    log.snapshot = snapshot_path
+    log.snapshot = storage_path
     log.save()
 
     return log.snapshot
@@ -140,11 +730,14 @@ def archive_nsem_covered_data_task(nsem_id):
         settings.CWWED_COVERED_DATA_DIR_NAME,
     )
 
+    # copy the snapshots (and their indexes) to versioned nsem location in default storage
+    paths = []
     for log in logs_to_archive:
         src_path = log.snapshot
         dest_path = os.path.join(storage_path, os.path.basename(src_path))
-        # copy snapshot to versioned nsem location in default storage
-        S3ObjectStoragePrivate().copy_within_storage(src_path, dest_path)
+        paths.append((src_path, dest_path))
+        paths.append((archive_index_path(src_path), archive_index_path(dest_path)))
+    S3ObjectStoragePrivate().copy_many_within_storage(paths)
 
     nsem.covered_data_logs.set(logs_to_archive)  # many to many field
     nsem.covered_data_snapshot = storage_path
@@ -171,16 +764,24 @@ def extract_nsem_covered_data_task(nsem_data: dict):
 
     # extract the archives
     for file in os.listdir(file_system_path):
-        if file.endswith(settings.CWWED_ARCHIVE_EXTENSION):
+        if file.endswith(tuple(ARCHIVE_EXTENSIONS.values())):
             file_path = os.path.join(file_system_path, file)
-            tar = tarfile.open(file_path, settings.CWWED_NSEM_ARCHIVE_READ_MODE)
-            tar.extractall(file_system_path)
-            tar.close()
+            _extract_archive(file_path, file_system_path)
             # remove the original archive now that it's extracted
             os.remove(file_path)
+        # the archives' indexes are only used to retrieve files from object storage
+        elif file.endswith(settings.CWWED_ARCHIVE_INDEX_EXTENSION):
+            os.remove(os.path.join(file_system_path, file))
     return NSEMSerializer(instance=nsem).data
 
 
+def _extract_archive(path: str, destination: str):
+    # decompress (in parallel when possible) on separate threads while the files are extracted
+    with archive_reader(path) as decompressed:
+        with tarfile.open(fileobj=decompressed, mode='r|') as tar:
+            tar.extractall(destination)
+
+
 class ExtractNSEMTaskBase(app.Task):
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
@@ -254,9 +855,7 @@ def extract_nsem_model_output_task(nsem_id):
     storage.download_file(storage.path(storage_path), file_system_path)
 
     # extract the tgz
-    tar = tarfile.open(file_system_path, settings.CWWED_NSEM_ARCHIVE_READ_MODE)
-    tar.extractall(os.path.dirname(file_system_path))
-    tar.close()
+    _extract_archive(file_system_path, os.path.dirname(file_system_path))
 
     # recursively update the permissions for all extracted directories and files
     for root, dirs, files in os.walk(os.path.dirname(file_system_path)):
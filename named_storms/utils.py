@@ -5,7 +5,6 @@ from urllib import parse
 from django.http.request import HttpRequest
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.core.files import File
 
 from cwwed import slack
 from named_storms.models import (
@@ -121,24 +120,6 @@ def named_storm_nsem_version_path(nsem: NSEM) -> str:
         'v{}'.format(nsem.id))
 
 
-def copy_path_to_default_storage(source_path: str, destination_path: str):
-    """
-    Copies source to destination using object storage and returns the path
-    """
-    from cwwed.storage_backends import S3ObjectStoragePrivate  # local import prevents circular dependency
-
-    # copy path to default storage
-    with File(open(source_path, 'rb')) as fd:
-        storage = S3ObjectStoragePrivate()
-
-        # remove any existing storage
-        if storage.exists(destination_path):
-            storage.delete(destination_path)
-        storage.save(destination_path, fd)
-
-    return destination_path
-
-
 def get_superuser_emails():
     return [u.email for u in User.objects.filter(is_superuser=True) if u.email]
 